@@ -0,0 +1,73 @@
+"""Import time benchmark of the modules of the library.
+
+Imports each module in a fresh interpreter repeatedly and reports the median
+import time in seconds and the heavy dependencies that are imported with it.
+With --max-seconds the benchmark fails if the import of a module takes longer,
+and with --forbid if it imports one of the given dependencies, to guard
+against regressions of the startup time of worker processes.
+
+Run from the top level directory of the repository with
+
+    > PYTHONPATH="." python benchmarks/imports.py --max-seconds 0.1 --forbid sklearn requests
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+
+MODULES = (
+    'numblr.datagenerator',
+    'numblr.datagenerator.samplers',
+    'numblr.datagenerator.encoders',
+    'numblr.datagenerator.dataset',
+    'numblr.datagenerator.factories')
+
+DEPENDENCIES = ('numpy', 'pandas', 'scipy', 'sklearn', 'requests')
+
+SCRIPT = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{ 'seconds': seconds,
+        'imported': [ name for name in {dependencies!r} if name in sys.modules ] }}))
+"""
+
+
+def measure(module, repeat):
+    """Import the module in repeat fresh interpreters, return the median
+    seconds and the dependencies that were imported."""
+    script = SCRIPT.format(module=module, dependencies=DEPENDENCIES)
+    runs = [ json.loads(subprocess.run([sys.executable, '-c', script],
+            check=True, stdout=subprocess.PIPE).stdout) for _ in range(repeat) ]
+
+    return {
+        'module': module,
+        'seconds': statistics.median(run['seconds'] for run in runs),
+        'imported': runs[-1]['imported'] }
+
+
+def main(modules, repeat, max_seconds=None, forbid=()):
+    results = [ measure(module, repeat) for module in modules ]
+    print(json.dumps(results, indent=2))
+
+    failures = [ result['module'] for result in results
+            if max_seconds is not None and result['seconds'] > max_seconds
+                    or set(forbid) & set(result['imported']) ]
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modules', nargs='+', default=list(MODULES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float,
+            help="fail if the import of a module takes longer")
+    parser.add_argument('--forbid', nargs='+', default=[],
+            help="fail if the import of a module imports one of the dependencies")
+    arguments = parser.parse_args()
+
+    sys.exit(main(arguments.modules, arguments.repeat, arguments.max_seconds, arguments.forbid))
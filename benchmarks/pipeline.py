@@ -0,0 +1,203 @@
+"""Throughput benchmark of the data pipeline on a synthetic file tree.
+
+Creates an inventory of synthetic data files, similar to the MNIST example but
+without Keras, and measures enrich_inventory, GeneratorDataSet.batches(),
+data(), split() and shuffle() for several batch sizes and encoder types. The
+results are written as JSON, with records/sec, batches/sec and batch latency
+percentiles of each measurement and the peak resident set size of the process
+after it, to compare the performance of releases.
+
+Run from the top level directory of the repository with
+
+    > PYTHONPATH="." python benchmarks/pipeline.py --records 20000 --output results.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from numblr.datagenerator.dataset import GeneratorDataSet
+from numblr.datagenerator.encoders import FileDataEncoder, RecordTargetEncoder, LabelEncoder
+from numblr.datagenerator.factories import enrich_inventory
+
+
+SHAPE = (28, 28)
+DIRECTORIES = 16
+CLASSES = 10
+SUFFIX = '.bin'
+
+
+def create_files(path, records, random_state=0):
+    """Write records files with random bytes of SHAPE into DIRECTORIES
+    subdirectories of path and return the inventory of the files."""
+    random = np.random.RandomState(random_state)
+    for directory in range(DIRECTORIES):
+        os.makedirs(os.path.join(path, str(directory)), exist_ok=True)
+
+    ids = [ '{}/{}'.format(i % DIRECTORIES, i) for i in range(records) ]
+    for id in ids:
+        with open(os.path.join(path, id + SUFFIX), 'wb') as data_file:
+            data_file.write(random.randint(0, 256, SHAPE, dtype=np.uint8).tobytes())
+
+    return pd.DataFrame({
+        'id': ids,
+        'target': [ 'class_{}'.format(i) for i in random.randint(0, CLASSES, records) ] })
+
+
+def map_id(id):
+    return id + SUFFIX
+
+
+def encode_raw(file):
+    return np.frombuffer(file.read(), dtype=np.uint8).reshape(SHAPE)
+
+
+def encode_normalized(file):
+    return np.frombuffer(file.read(), dtype=np.uint8).astype(np.float32).reshape(-1) / 255
+
+
+class SpecEncoder:
+    """Encoder that declares the shape and dtype of the encoded records."""
+    output_spec = (SHAPE, np.uint8)
+
+    def __call__(self, file):
+        return encode_raw(file)
+
+
+ENCODERS = {
+    'raw': encode_raw,
+    'normalized': encode_normalized,
+    'output_spec': SpecEncoder() }
+
+
+def peak_rss():
+    """Peak resident set size of the process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def result(name, parameters, elapsed, records, latencies=None):
+    measurement = dict(parameters, name=name, seconds=elapsed,
+            records_per_second=records / elapsed if elapsed > 0 else None,
+            peak_rss_bytes=peak_rss())
+    if latencies:
+        latencies = np.asarray(latencies)
+        measurement.update(batches=len(latencies),
+                batches_per_second=len(latencies) / elapsed,
+                latency_seconds={ 'p50': np.percentile(latencies, 50),
+                        'p90': np.percentile(latencies, 90),
+                        'p99': np.percentile(latencies, 99),
+                        'max': latencies.max() })
+
+    return measurement
+
+
+def measure(function):
+    start = time.perf_counter()
+    value = function()
+
+    return time.perf_counter() - start, value
+
+
+def measure_batches(generator):
+    latencies = []
+    records = 0
+    start = time.perf_counter()
+    while True:
+        batch_start = time.perf_counter()
+        try:
+            data, _ = next(generator)
+        except StopIteration:
+            break
+        latencies.append(time.perf_counter() - batch_start)
+        records += len(data)
+
+    return time.perf_counter() - start, records, latencies
+
+
+def create_encoders(path, encoder):
+    data_encoder = FileDataEncoder(encoder, path, id_mapper=map_id, binary=True)
+    target_encoder = RecordTargetEncoder(LabelEncoder())
+
+    return data_encoder, target_encoder
+
+
+def run(path, inventory, batch_sizes, encoders, prefetch, workers):
+    results = []
+
+    data_encoder, target_encoder = create_encoders(path, encode_raw)
+    elapsed, enriched = measure(lambda: enrich_inventory(inventory.copy(), data_encoder))
+    results.append(result('enrich_inventory', {}, elapsed, len(inventory)))
+
+    for encoder_name in encoders:
+        data_encoder, target_encoder = create_encoders(path, ENCODERS[encoder_name])
+        data_set = GeneratorDataSet(enriched.copy(), data_encoder, target_encoder)
+        data_set.fit_encoders()
+
+        for batch_size in batch_sizes:
+            parameters = { 'encoder': encoder_name, 'batch_size': batch_size,
+                    'prefetch': prefetch, 'workers': workers }
+            elapsed, records, latencies = measure_batches(data_set.batches(batch_size=batch_size,
+                    epochs=1, truncate=False, prefetch=prefetch, workers=workers))
+            results.append(result('batches', parameters, elapsed, records, latencies))
+
+        elapsed, _ = measure(data_set.data)
+        results.append(result('data', { 'encoder': encoder_name }, elapsed, data_set.size))
+
+    data_set = GeneratorDataSet(enriched.copy(), data_encoder, target_encoder)
+    elapsed, _ = measure(lambda: data_set.split(validation=0.2, test=0.1))
+    results.append(result('split', {}, elapsed, data_set.size))
+
+    elapsed, _ = measure(lambda: data_set.shuffle(random_state=0))
+    results.append(result('shuffle', {}, elapsed, data_set.size))
+
+    return results
+
+
+def main(records, batch_sizes, encoders, prefetch, workers, path=None, output=None):
+    temporary = path is None
+    path = tempfile.mkdtemp(prefix='datagenerator-benchmark-') if temporary else path
+    try:
+        inventory = create_files(path, records)
+        results = {
+            'records': records,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'results': run(path, inventory, batch_sizes, encoders, prefetch, workers) }
+    finally:
+        if temporary:
+            shutil.rmtree(path)
+
+    text = json.dumps(results, indent=2, default=float)
+    if output is None:
+        print(text)
+    else:
+        with open(output, 'w') as output_file:
+            output_file.write(text)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[32, 128, 512])
+    parser.add_argument('--encoders', nargs='+', choices=sorted(ENCODERS.keys()),
+            default=sorted(ENCODERS.keys()))
+    parser.add_argument('--prefetch', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--path', help="directory for the synthetic files, "
+            + "a temporary directory that is removed afterwards by default")
+    parser.add_argument('--output', help="file for the JSON results, stdout by default")
+    arguments = parser.parse_args()
+
+    main(arguments.records, arguments.batch_sizes, arguments.encoders,
+            arguments.prefetch, arguments.workers, arguments.path, arguments.output)
@@ -0,0 +1,69 @@
+"""Micro-benchmark of the framework overhead per record in the batch hot path.
+
+Compares DataFrame.iterrows(), which creates a pandas.Series per row, with the
+lightweight records of numblr.datagenerator.records and measures the overhead
+of GeneratorDataSet.data_batches() for an encoder that does no work.
+
+Run from the top level directory of the repository with
+
+    > PYTHONPATH="." python benchmarks/records.py --rows 1000000
+"""
+import argparse
+import time
+
+from pandas import DataFrame
+
+from numblr.datagenerator.dataset import GeneratorDataSet
+from numblr.datagenerator.records import inventory_records
+
+
+def create_inventory(rows):
+    return DataFrame({
+        'id': [ 'id_{}'.format(i) for i in range(rows) ],
+        'target': [ 'cat_{}'.format(i % 10) for i in range(rows) ],
+        'size': range(rows) })
+
+
+def iterate_rows(inventory, batch_size):
+    for i in range(0, len(inventory), batch_size):
+        for _, record in inventory.iloc[i:i + batch_size].iterrows():
+            record['id']
+
+
+def iterate_records(inventory, batch_size):
+    for i in range(0, len(inventory), batch_size):
+        for record in inventory_records(inventory.iloc[i:i + batch_size]):
+            record['id']
+
+
+def encode_batches(inventory, batch_size):
+    data_set = GeneratorDataSet(inventory, lambda record: record['size'], lambda batch: None)
+    for _ in data_set.data_batches(batch_size=batch_size, epochs=1):
+        pass
+
+
+def measure(name, function, inventory, batch_size):
+    start = time.perf_counter()
+    function(inventory, batch_size)
+    elapsed = time.perf_counter() - start
+
+    print('{:<16} {:>10.3f} s {:>10.3f} us/record'.format(name,
+            elapsed, 1e6 * elapsed / len(inventory)))
+
+
+def main(rows, batch_size):
+    inventory = create_inventory(rows)
+    print('{} rows, batch size {}'.format(rows, batch_size))
+
+    measure('iterrows', iterate_rows, inventory, batch_size)
+    measure('records', iterate_records, inventory, batch_size)
+    measure('data_batches', encode_batches, inventory, batch_size)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--batch-size', type=int, default=128)
+    arguments = parser.parse_args()
+
+    main(arguments.rows, arguments.batch_size)
@@ -1,9 +1,39 @@
 __version__ = '0.0.1'
 __copyright__ = "Copyright 2018, Thomas Baier"
 
-__all__ = ['dataset', 'encoders']
+__all__ = ['dataset', 'encoders', 'samplers']
 
-from numblr.datagenerator.factories import (generator_for_files, generator_for_urls,
-        inventory_from_csv, inventory_from_records, inventory_from_dict, inventory_from_items)
-from numblr.datagenerator.encoders import (LabelEncoder, IntToOneHotEncoder,
-        FileDataEncoder, UrlDataEncoder, IdentityEncoder)
+import importlib
+
+# The public names are imported from their modules on first access, such that
+# importing the package does not import pandas, scikit-learn or requests.
+_EXPORTS = {
+    'numblr.datagenerator.factories': ('generator_for_files', 'generator_for_urls',
+        'generator_for_shards', 'generator_for_archives',
+        'inventory_from_csv', 'inventory_from_records', 'inventory_from_dict', 'inventory_from_items'),
+    'numblr.datagenerator.encoders': ('LabelEncoder', 'IntToOneHotEncoder',
+        'FileDataEncoder', 'UrlDataEncoder', 'IdentityEncoder', 'PaddingDataEncoder',
+        'CachingDataEncoder', 'ArchiveDataEncoder'),
+    'numblr.datagenerator.httpcache': ('HttpCache',),
+    'numblr.datagenerator.metrics': ('MetricsCollector',),
+    'numblr.datagenerator.samplers': ('SequentialSampler', 'ShuffleSampler', 'BucketSampler',
+        'DistributedSampler', 'LocalitySampler') }
+
+_MODULES = { name: module for module, names in _EXPORTS.items() for name in names }
+
+
+def __getattr__(name):
+    if name in _MODULES:
+        value = getattr(importlib.import_module(_MODULES[name]), name)
+        globals()[name] = value
+
+        return value
+
+    if name in __all__:
+        return importlib.import_module(__name__ + '.' + name)
+
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_MODULES) | set(__all__))
@@ -1,9 +1,20 @@
+import os
+import time
 import logging
 import copy
+from itertools import chain
+from collections import deque
 
 import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
+
+from numblr.datagenerator import shards
+from numblr.datagenerator.shards import ShardWriter
+from numblr.datagenerator.records import inventory_records
+from numblr.datagenerator.samplers import SequentialSampler, ShuffleSampler, DistributedSampler
+from numblr.datagenerator.execution import ProcessPool, prefetch as prefetched
+from numblr.datagenerator.metrics import MetricsCollector
+from numblr.datagenerator import sequences
 
 
 logger = logging.getLogger()
@@ -15,16 +26,33 @@ class GeneratorDataSet:
             raise ValueError("inventory must be a pandas.DataFrame")
 
         self._inventory = inventory
+        self._positions = None
+        self._views = {}
         self._data_encoder = data_encoder
         self._target_encoder = target_encoder
+        self._encoded_targets = None
+        self._metrics = None
+        self._pool = None
 
     @property
     def inventory(self):
+        """The inventory of the records.
+
+        The data sets created by split() and folds() share the inventory of the
+        data set they were split from and only hold the positions of their
+        records. On first access their records are copied into an own
+        inventory, which is then also used for the batches, such that changes
+        to it take effect. Changes to the targets of records with encoded
+        targets only take effect once encode_targets() is called again.
+        """
+        if self._positions is not None:
+            self.__set_inventory(self._inventory.take(self._positions))
+
         return self._inventory
 
     @property
     def size(self):
-        return len(self.inventory)
+        return len(self._inventory) if self._positions is None else len(self._positions)
 
     @property
     def data_encoder(self):
@@ -34,131 +62,750 @@ class GeneratorDataSet:
     def target_encoder(self):
         return self._target_encoder
 
-    def fit_encoders(self):
+    @property
+    def metrics(self):
+        return self._metrics
+
+    def instrument(self, collector=None):
+        """Record the timings of the stages of the batch pipeline with the
+        collector, a new MetricsCollector by default, and return the collector.
+
+        With processes > 0 the records are encoded in the worker processes and
+        only the duration of the transform stage of each batch is recorded.
+        """
+        self._metrics = collector if collector is not None else MetricsCollector()
+
+        return self._metrics
+
+    def disable_instrumentation(self):
+        self._metrics = None
+
+    def fit_encoders(self, encode_targets=True):
+        """Fit the target and data encoders to the inventory.
+
+        With encode_targets=True the targets of all records are encoded once
+        after fitting, see encode_targets.
+        """
         self.target_encoder.fit(self.inventory)
         try:
             [ encoder.fit(self.inventory) for encoder in self.data_encoder ]
         except TypeError:
             self.data_encoder.fit(self.inventory)
 
+        if encode_targets:
+            self.encode_targets()
+
+    def encode_targets(self):
+        """Encode the targets of all records in the inventory at once.
+
+        The target batches are then taken from the encoded targets instead of
+        transforming the targets of each batch. The encoded targets are kept in
+        memory and are looked up by the index of the inventory, which therefore
+        must be unique. Records that are added to the inventory later are
+        transformed per batch, while changes to the targets of the inventory
+        require to encode the targets again.
+
+        If the target encoder provides compact_transform and expand, like the
+        RecordTargetEncoder, only the compact targets are kept, e.g. the labels
+        instead of one-hot vectors, and each target batch is expanded.
+        """
+        self._encoded_targets = None
+        inventory = self.inventory
+        if self._target_encoder is None or not inventory.index.is_unique:
+            return
+
+        if hasattr(self._target_encoder, 'compact_transform'):
+            targets = _as_targets(self._target_encoder.compact_transform(inventory))
+        else:
+            targets = self.__transform_targets(inventory)
+        if targets.ndim > 0 and targets.shape[0] == self.size:
+            self._encoded_targets = (inventory.index, targets)
+
     def sort(self, columns=['size'], ascending=True, na_position='last'):
-        self._inventory.sort_values(by=columns, ascending=ascending, na_position=na_position, inplace=True)
+        self.__set_inventory(self.inventory.sort_values(by=columns, ascending=ascending,
+                na_position=na_position))
 
     def shuffle(self, random_state=None):
-        self._inventory = self._inventory \
+        positions = pd.Series(np.arange(self.size)) \
                 .sample(frac=1, random_state=random_state) \
-                .reset_index(drop=True)
-
-    def split(self, validation=0.2, test=0.0):
+                .to_numpy()
+        inventory = self._records(positions)
+        rows = self.__encoded_target_rows(inventory.index)
+
+        self.__set_inventory(inventory.reset_index(drop=True))
+        if rows is not None:
+            self._encoded_targets = (self._inventory.index, self._encoded_targets[1][rows])
+
+    def split(self, validation=0.2, test=0.0, stratify=None, random_state=None):
+        """Split the records randomly into a training, validation and test
+        data set.
+
+        The data sets share the inventory of this data set and only hold the
+        positions of their records. With stratify, the name of an inventory
+        column such as the target, the values of the column have about the same
+        proportions in each data set as in the whole data set.
+        """
         if validation < 0.0 or 1.0 < validation:
             raise ValueError("validation ratio must be between 0.0 and 1.0: " + str(validation))
         if test < 0.0 or 1.0 < test:
-            raise ValueError("validation ratio must be between 0.0 and 1.0: " + str(validation))
+            raise ValueError("test ratio must be between 0.0 and 1.0: " + str(test))
         if test + validation > 1.0:
-            raise ValueError("validation plus test size exceed 1.0: " + str(test_ratio + validation))
+            raise ValueError("validation plus test size exceed 1.0: " + str(test + validation))
 
         test_size = int(round(self.size * test))
         validation_size = int(round(self.size * validation))
-
-        learning_set, test_set = train_test_split(self.inventory, test_size=test_size)
-        training_set, validation_set = train_test_split(learning_set, test_size=validation_size)
-
-        return self._clone_with_inventory(training_set), \
-                self._clone_with_inventory(validation_set), \
-                self._clone_with_inventory(test_set)
-
-    def data(self):
-        data = next(self.data_batches(batch_size=self.size, epochs=1))
-
-        return np.array([x for x in data], copy=False)
+        order = self.__split_order(stratify, random_state)
+
+        return self._clone_with_positions(order[test_size + validation_size:]), \
+                self._clone_with_positions(order[test_size:test_size + validation_size]), \
+                self._clone_with_positions(order[:test_size])
+
+    def folds(self, k=5, stratify=None, random_state=None):
+        """Generate k tuples of a training and a validation data set for k-fold
+        cross-validation.
+
+        The validation data sets of the folds are disjoint and cover all
+        records, the data sets share the inventory and are stratified as with
+        split().
+        """
+        if not isinstance(k, int) or not 2 <= k <= self.size:
+            raise ValueError("k must be an integer between 2 and the size of the data set: " + str(k))
+
+        order = self.__split_order(stratify, random_state)
+
+        return ( self.__fold(order, k, fold) for fold in range(k) )
+
+    def __fold(self, order, k, fold):
+        validation = np.zeros(len(order), dtype=bool)
+        validation[fold::k] = True
+
+        return self._clone_with_positions(order[~validation]), \
+                self._clone_with_positions(order[validation])
+
+    def __split_order(self, stratify, random_state):
+        """Return a random permutation of the positions of the records.
+
+        With stratify the records of each value of the column are spread
+        evenly over the permutation, such that every slice of it has about the
+        proportions of the values of the whole data set.
+        """
+        random = random_state if isinstance(random_state, np.random.RandomState) \
+                else np.random.RandomState(random_state)
+        order = random.permutation(self.size)
+        if stratify is None:
+            return order
+
+        codes, _ = pd.factorize(self.__view((stratify,))[stratify].to_numpy()[order])
+        codes = codes + 1
+        counts = np.bincount(codes)
+        grouped = np.argsort(codes, kind='stable')
+        ranks = np.empty(len(codes))
+        ranks[grouped] = np.arange(len(codes)) - np.repeat(np.cumsum(counts) - counts, counts)
+        keys = (ranks + random.random_sample(len(counts))[codes]) / counts[codes]
+
+        return order[np.argsort(keys, kind='stable')]
+
+    def data(self, processes=0, locality=False):
+        """Encode the data of all records.
+
+        With locality=True the records are read in the locality_order of the
+        first data encoder that provides it, e.g. by directory and inode for a
+        FileDataEncoder, and the data is returned in inventory order.
+        """
+        if not locality:
+            return np.asarray(next(self.data_batches(batch_size=self.size, epochs=1,
+                    processes=processes)))
+
+        order = self.__locality_order()
+        data_set = self._clone_with_positions(order)
+        data = next(data_set.data_batches(batch_size=self.size, epochs=1, processes=processes))
+
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(len(order))
+        if isinstance(data, list):
+            return [ np.asarray(encoded)[inverse] for encoded in data ]
+
+        return np.asarray(data)[inverse]
+
+    def __locality_order(self):
+        for encoder in self.__data_encoders():
+            if hasattr(encoder, 'locality_order'):
+                return np.asarray(encoder.locality_order(self.inventory))
+
+        raise ValueError("locality requires a data encoder with locality_order")
 
     def targets(self):
         targets = next(self.target_batches(batch_size=self.size, epochs=1))
 
-        return np.array([x for x in targets], copy=False)
-
-    def batches(self, batch_size=10, epochs=None, truncate=True):
+        return _as_targets(targets)
+
+    def materialize(self, path, shard_size=10000, batch_size=128, prefetch=0, workers=1,
+            processes=0):
+        """Encode the data and targets of all records once and write them into
+        .npy shards of shard_size records in the directory path.
+
+        The inventory is written to the index file of the shards with the
+        shard and offset of each record. The encoded records must all have the
+        same shape. Use generator_for_shards to load the materialized data set.
+        """
+        os.makedirs(path, exist_ok=True)
+        batch_size = max(1, min(batch_size, self.size))
+
+        if self._target_encoder is None:
+            generator = ( (data, None) for data in self.data_batches(batch_size, epochs=1,
+                    truncate=False, prefetch=prefetch, workers=workers, processes=processes) )
+        else:
+            generator = self.batches(batch_size, epochs=1, truncate=False,
+                    prefetch=prefetch, workers=workers, processes=processes)
+
+        writer = ShardWriter(path, self.size, shard_size)
+        encoders = 1
+        position = 0
+        try:
+            for data, targets in generator:
+                data = data if isinstance(data, list) else [data]
+                encoders = len(data)
+
+                for index, batch in enumerate(data):
+                    writer.write(shards.data_name(index), position, batch)
+                if hasattr(targets, 'tocsr'):
+                    # Sparse targets, e.g. of the IntToOneHotEncoder, are stored dense
+                    targets = targets.toarray()
+                if targets is not None:
+                    writer.write(shards.TARGETS, position, targets)
+
+                position += len(data[0])
+        finally:
+            writer.close()
+
+        positions = np.arange(self.size)
+        self.inventory \
+                .assign(shard=positions // shard_size, offset=positions % shard_size) \
+                .to_csv(os.path.join(path, shards.INDEX_FILE), index=False)
+        shards.write_meta(path, shard_size, encoders, self._target_encoder is not None)
+
+    def batches(self, batch_size=10, epochs=None, truncate=True, prefetch=0, workers=1,
+            processes=0, shared_memory=False, shuffle_each_epoch=False, random_state=None,
+            sampler=None, num_shards=1, shard_index=0):
+        """Generate tuples of data and target batches.
+
+        With prefetch > 0 up to prefetch upcoming batches are created in the
+        background by a pool of worker threads. Batches are still generated in
+        inventory order.
+
+        With processes > 0 the records of each batch are encoded by the data
+        encoders in a pool of worker processes, which is started when the
+        generator is first used and stopped when it is exhausted or closed.
+
+        With shared_memory=True the worker processes write the encoded records
+        directly into shared memory and the data batches are views on it. The
+        shared memory of a batch is reused once the next batch is requested,
+        copy the batch to keep it longer.
+
+        With shuffle_each_epoch=True the records are drawn in a different random
+        order in each epoch without modifying the inventory. The order of each
+        epoch is determined by random_state and the epoch.
+
+        A sampler, e.g. a BucketSampler, can be given to customize which
+        records are drawn into the batches of each epoch.
+
+        The returned BatchIterator can be checkpointed with state_dict() and
+        resumed with load_state_dict().
+
+        With num_shards > 1 only the batches of the shard shard_index of
+        num_shards disjoint shards with the same number of batches are
+        generated in each epoch, see DistributedSampler. Shuffling samplers
+        require the same random_state for all shards.
+        """
         self.__validate_batch_size(batch_size, truncate)
 
-        return ( (self._get_batch_data(batch), self._get_batch_targets(batch))
-                for batch in self.__inventory_batches(batch_size, epochs, truncate) )
+        return self.__iterate('_get_batch', batch_size, epochs, truncate,
+                self.__sampler(sampler, shuffle_each_epoch, num_shards, shard_index, random_state),
+                random_state, prefetch, workers, processes, shared_memory)
+
+    def data_batches(self, batch_size=10, epochs=None, truncate=True, prefetch=0, workers=1,
+            processes=0, shared_memory=False, shuffle_each_epoch=False, random_state=None,
+            sampler=None, num_shards=1, shard_index=0):
+        self.__validate_batch_size(batch_size, truncate)
 
-    def data_batches(self, batch_size=10, epochs=None, truncate=True):
+        return self.__iterate('_get_batch_data', batch_size, epochs, truncate,
+                self.__sampler(sampler, shuffle_each_epoch, num_shards, shard_index, random_state),
+                random_state, prefetch, workers, processes, shared_memory)
+
+    def sequence(self, batch_size=10, truncate=True, shuffle_each_epoch=False, random_state=None,
+            sampler=None, num_shards=1, shard_index=0):
+        """Random access to the tuples of data and target batches of an epoch.
+
+        The returned BatchSequence has a length and returns the batch at an
+        index, it advances to the next epoch with on_epoch_end(). The arguments
+        are the same as for batches().
+        """
+        return self.__sequence(sequences.BatchSequence, batch_size, truncate, shuffle_each_epoch,
+                random_state, sampler, num_shards, shard_index)
+
+    def keras_sequence(self, batch_size=10, truncate=True, shuffle_each_epoch=False,
+            random_state=None, sampler=None, num_shards=1, shard_index=0, **kwargs):
+        """Like sequence(), but returns a keras.utils.Sequence to fit Keras
+        models with parallel workers. Additional keyword arguments are passed
+        to the Sequence."""
+        return self.__sequence(sequences.KerasBatchSequence, batch_size, truncate, shuffle_each_epoch,
+                random_state, sampler, num_shards, shard_index, **kwargs)
+
+    def __sequence(self, sequence_type, batch_size, truncate, shuffle_each_epoch, random_state,
+            sampler, num_shards, shard_index, **kwargs):
         self.__validate_batch_size(batch_size, truncate)
+        sampler = self.__sampler(sampler, shuffle_each_epoch, num_shards, shard_index, random_state)
+        if random_state is None:
+            random_state = int(np.random.randint(2**31))
 
-        return ( self._get_batch_data(batch)
-                for batch in self.__inventory_batches(batch_size, epochs, truncate) )
+        return sequence_type(self, '_get_batch', batch_size if batch_size > 0 else self.size,
+                truncate, sampler, random_state, **kwargs)
+
+    def _get_batch(self, batch):
+        return self._get_batch_data(batch), self._get_batch_targets(batch)
 
     def _get_batch_data(self, batch):
         """Override to customize batch data loading and featurization."""
-        try:
-            encoders = [ encoder for encoder in self._data_encoder ]
-        except:
-            encoders = (self._data_encoder,)
+        encoders = self.__data_encoders()
 
-        try:
-            data_batches = [ encoder.transform_batch(rec for _, rec in batch.iterrows())
-                    for encoder in encoders ]
-        except AttributeError:
-            data_batches = [
-                    [ self._get_data(record, encoder) for _, record in batch.iterrows() ]
-                    for encoder in encoders ]
+        start = time.perf_counter() if self._metrics is not None else None
+        records = inventory_records(batch)
+        start = self.__observe_stage('records', start)
+
+        if self._pool is None:
+            data_batches = [ self._encode_records(index, records) for index in range(len(encoders)) ]
+        else:
+            data_batches = [ self._pool.encode(index, records) for index in range(len(encoders)) ]
+        start = self.__observe_stage('transform', start)
 
         try:
-            batches = [ np.array(encoder.finalize_batch(batch))
+            batches = [ np.asarray(encoder.finalize_batch(batch))
                     for encoder, batch in zip(encoders, data_batches)]
         except AttributeError:
-            batches = [ np.array(batch) for batch in data_batches ]
+            batches = [ np.asarray(batch) for batch in data_batches ]
+        self.__observe_stage('finalize', start)
 
         return batches if len(batches) > 1 else batches[0]
 
-    def _get_data(self, record, encoder):
-        """Override to customize data loading and featurization."""
+    def __observe_stage(self, stage, start):
+        """Record the duration of the stage since start and return the end of
+        the stage, a no-op if start is None."""
+        if start is None:
+            return None
+
+        end = time.perf_counter()
+        self._metrics.observe_stage(stage, end - start)
+
+        return end
+
+    def _encode_records(self, encoder_index, records, out=None):
+        """Encode the records with the data encoder at encoder_index.
+
+        If out is given, the records are encoded into it and out is returned,
+        unless they can not be cast safely to its dtype.
+        """
+        encoder = self.__data_encoders()[encoder_index]
+
         try:
-            return encoder.transform(record)
+            data = encoder.transform_batch(records)
         except AttributeError:
-            return encoder(record)
+            return self.__encode_each(encoder, records, encoder_index, out)
+
+        return data if out is None else self.__copy_into(encoder, data, out)
+
+    def _output_spec(self, encoder_index):
+        return getattr(self.__data_encoders()[encoder_index], 'output_spec', None)
+
+    def __copy_into(self, encoder, data, out):
+        data = [ np.asarray(encoded) for encoded in data ]
+        casting = 'same_kind' if getattr(encoder, 'output_spec', None) is not None else 'safe'
+
+        for encoded in data:
+            if encoded.shape != out.shape[1:]:
+                raise ValueError("encoded record shape differs from first batch: "
+                        + str(encoded.shape) + " != " + str(out.shape[1:]))
+            if not np.can_cast(encoded.dtype, out.dtype, casting):
+                return data
+
+        for position, encoded in enumerate(data):
+            out[position] = encoded
+
+        return out
+
+    def __encode_each(self, encoder, records, encoder_index=0, out=None):
+        """Encode the records into a preallocated array if the shape and dtype
+        of the encoded records is declared by the output_spec of the encoder,
+        or can be inferred from the first encoded record.
+
+        The shape and dtype are only inferred if the encoder does not finalize
+        batches and the first record is encoded to a numpy array. If a record
+        does not match the inferred shape and dtype a list of encoded records is
+        returned instead.
+
+        If out is given, the records are encoded into it instead, where a
+        record that does not match its shape raises a ValueError.
+        """
+        if self._metrics is None:
+            data = ( self._get_data(record, encoder) for record in records )
+        else:
+            data = self.__timed_data(encoder, records, encoder_index)
+        output_spec = getattr(encoder, 'output_spec', None)
+
+        if out is not None:
+            shape, dtype = out.shape[1:], out.dtype
+        elif output_spec is not None:
+            shape, dtype = output_spec
+        elif len(records) > 0 and not self.__finalizes_batch(encoder):
+            first = next(data)
+            if not isinstance(first, np.ndarray):
+                return [first] + list(data)
+
+            shape, dtype = first.shape, first.dtype
+            data = chain((first,), data)
+        else:
+            return list(data)
+
+        # Records are cast to a declared dtype, but never narrowed to an inferred one
+        casting = 'same_kind' if output_spec is not None else 'safe'
+        batch = np.empty((len(records),) + tuple(shape), dtype=dtype) if out is None else out
+        for position, encoded in enumerate(data):
+            encoded = np.asarray(encoded)
+            if encoded.shape != batch.shape[1:] \
+                    or not np.can_cast(encoded.dtype, batch.dtype, casting):
+                if output_spec is not None:
+                    raise ValueError("encoded record does not match output_spec: "
+                            + str((encoded.shape, encoded.dtype)) + " != " + str(output_spec))
+                if out is not None and encoded.shape != batch.shape[1:]:
+                    raise ValueError("encoded record shape differs from first batch: "
+                            + str(encoded.shape) + " != " + str(batch.shape[1:]))
+
+                # Copy the records encoded so far, out is reused for later batches
+                return list(batch[:position].copy()) + [encoded] + list(data)
+
+            batch[position] = encoded
+
+        return batch
+
+    def __timed_data(self, encoder, records, encoder_index):
+        for record in records:
+            start = time.perf_counter()
+            data = self._get_data(record, encoder)
+            self._metrics.observe_record(encoder_index, time.perf_counter() - start)
+
+            yield data
+
+    def __finalizes_batch(self, encoder):
+        return getattr(encoder, 'finalizes_batch', hasattr(encoder, 'finalize_batch'))
+
+    def __data_encoders(self):
+        try:
+            return [ encoder for encoder in self._data_encoder ]
+        except:
+            return (self._data_encoder,)
+
+    def _get_data(self, record, encoder):
+        """Override to customize data loading and featurization."""
+        transform = getattr(encoder, 'transform', None)
 
-    def target_batches(self, batch_size=10, epochs=None, truncate=True):
+        return encoder(record) if transform is None else transform(record)
+
+    def target_batches(self, batch_size=10, epochs=None, truncate=True, prefetch=0, workers=1,
+            shuffle_each_epoch=False, random_state=None, sampler=None, num_shards=1, shard_index=0):
         """Override to customize batch target creation."""
         self.__validate_batch_size(batch_size, truncate)
 
-        return ( self._get_batch_targets(batch)
-                for batch in self.__inventory_batches(batch_size, epochs, truncate) )
+        return self.__iterate('_get_batch_targets', batch_size, epochs, truncate,
+                self.__sampler(sampler, shuffle_each_epoch, num_shards, shard_index, random_state),
+                random_state, prefetch, workers)
 
     def _get_batch_targets(self, batch):
         """Override to customize target creation."""
+        start = time.perf_counter() if self._metrics is not None else None
+
+        rows = self.__encoded_target_rows(batch.index)
+        if rows is not None:
+            targets = self.__expand_targets(self._encoded_targets[1][rows])
+        else:
+            targets = self.__transform_targets(batch)
+
+        self.__observe_stage('targets', start)
+
+        return targets
+
+    def __transform_targets(self, batch):
         try:
-            return np.array(self._target_encoder.transform(batch))
+            return _as_targets(self._target_encoder.transform(batch))
         except AttributeError:
-            return np.array(self._target_encoder(batch))
-
-    def __inventory_batches(self, batch_size, epochs, truncate):
+            return _as_targets(self._target_encoder(batch))
+
+    def __expand_targets(self, targets):
+        if not hasattr(self._target_encoder, 'compact_transform'):
+            return targets
+
+        return _as_targets(self._target_encoder.expand(targets))
+
+    def __encoded_target_rows(self, index):
+        """Return the rows of the encoded targets for the index labels or None
+        if the targets of any of the labels are not encoded."""
+        if self._encoded_targets is None:
+            return None
+
+        rows = self._encoded_targets[0].get_indexer(index)
+
+        return rows if (rows >= 0).all() else None
+
+    def __iterate(self, get_batch, batch_size, epochs, truncate, sampler, random_state,
+            prefetch, workers, processes=0, shared_memory=False):
+        if shared_memory and processes < 1:
+            raise ValueError("shared_memory requires processes > 0: " + str(processes))
+        if prefetch > 0 and workers < 1:
+            raise ValueError("number of workers must be at least 1: " + str(workers))
+        if random_state is None:
+            random_state = int(np.random.randint(2**31))
+
+        def generate(state, positions):
+            inventory_batches = self.__inventory_batches(batch_size, epochs, truncate, sampler,
+                    state['random_state'], state['epoch'], state['batch'], positions)
+
+            return self.__generate(get_batch, inventory_batches,
+                    state['prefetch'], state['workers'], state['processes'], shared_memory,
+                    batch_size if batch_size > 0 else self.size)
+
+        return BatchIterator(generate, batch_size, epochs, truncate, random_state,
+                prefetch, workers, processes)
+
+    def __generate(self, get_batch, inventory_batches, prefetch, workers,
+            processes=0, shared_memory=False, batch_size=None):
+        if processes > 0:
+            return self.__generate_in_processes(get_batch, inventory_batches,
+                    prefetch, workers, processes, shared_memory, batch_size)
+        else:
+            return self.__generate_batches(getattr(self, get_batch), inventory_batches,
+                    prefetch, workers)
+
+    def __generate_batches(self, get_batch, inventory_batches, prefetch, workers):
+        if prefetch > 0:
+            metrics = self._metrics
+            monitor = None if metrics is None else \
+                    lambda depth: metrics.set_gauge('prefetch_queue_depth', depth)
+
+            return prefetched(get_batch, inventory_batches, size=prefetch, workers=workers,
+                    monitor=monitor)
+        else:
+            return ( get_batch(batch) for batch in inventory_batches )
+
+    def __generate_in_processes(self, get_batch, inventory_batches, prefetch, workers,
+            processes, shared_memory, batch_size=None):
+        data_set = copy.copy(self)
+        worker_data_set = self._clone_with_inventory(self._inventory.iloc[:0])
+        worker_data_set._encoded_targets = None
+        worker_data_set._metrics = None
+        slots = prefetch + 2 if shared_memory else 0
+
+        with ProcessPool(worker_data_set, processes, slots, batch_size) as pool:
+            data_set._pool = pool
+            get_leased_batch = pool.leasing(getattr(data_set, get_batch))
+
+            for batch, lease in data_set.__generate_batches(get_leased_batch, inventory_batches,
+                    prefetch, workers):
+                try:
+                    yield batch
+                finally:
+                    lease.release()
+
+    def __inventory_batches(self, batch_size, epochs, truncate, sampler, random_state,
+            epoch=0, start=0, positions=None):
+        """Generate the inventory batches from batch start of the epoch on.
+
+        The epoch and the index of each generated batch in its epoch are
+        appended to positions.
+        """
         if batch_size < 1:
             batch_size = self.size
+        advisors = [ encoder for encoder in self.__data_encoders()
+                if getattr(encoder, 'readahead', False) ]
 
-        epoch = 0
         while epochs is None or epoch < epochs:
+            batches = self._epoch_batches(sampler, batch_size, truncate, random_state, epoch)
+            if epochs is None and len(batches) == 0:
+                raise ValueError("no batches in epoch " + str(epoch) + " of the sampler")
+
+            for index in range(start, len(batches)):
+                if positions is not None:
+                    positions.append((epoch, index))
+                if advisors and index + 1 < len(batches):
+                    self.__advise(advisors, batches[index + 1])
+
+                if self._metrics is None:
+                    yield self._records(batches[index])
+                else:
+                    batch_start = time.perf_counter()
+                    batch = self._records(batches[index])
+                    self.__observe_stage('inventory', batch_start)
+
+                    yield batch
+
+            start = 0
             epoch += 1
-            yield from ( self._inventory.iloc[i:i + batch_size]
-                    for i in range(0, self.size, batch_size)
-                    if i + batch_size <= self.size or not truncate )
 
         logger.info("Fetched " + str(epochs) + "batches")
 
+    def __advise(self, advisors, positions):
+        """Let the data encoders prepare reading the records of the next
+        batch, e.g. by readahead of their files."""
+        batch = self._records(positions)
+        for encoder in advisors:
+            encoder.advise_batch(batch)
+
+    def __sampler(self, sampler, shuffle_each_epoch, num_shards=1, shard_index=0, random_state=None):
+        if sampler is not None and shuffle_each_epoch:
+            raise ValueError("shuffle_each_epoch can not be combined with a sampler")
+
+        if sampler is not None:
+            pass
+        elif shuffle_each_epoch:
+            sampler = ShuffleSampler()
+        else:
+            sampler = SequentialSampler()
+
+        if num_shards == 1 and shard_index == 0:
+            return sampler
+        if random_state is None and not isinstance(sampler, SequentialSampler):
+            raise ValueError("num_shards > 1 requires the same random_state for all shards")
+
+        return DistributedSampler(sampler, num_shards, shard_index)
+
     def __validate_batch_size(self, batch_size, truncate):
         if truncate and batch_size > self.size:
             raise ValueError("batch_size larger than data set size: "
                     + str(batch_size) + " > " + str(self.size)
                     + ", use a valid batch_size or the 'truncate=False' option")
 
+    def _epoch_batches(self, sampler, batch_size, truncate, random_state, epoch):
+        """Return the batches of the sampler for the epoch.
+
+        Samplers with columns get a copy of only these columns of the inventory
+        of a data set that shares its inventory.
+        """
+        columns = getattr(sampler, 'columns', None)
+        inventory = self.__view(None if columns is None else tuple(columns))
+
+        return sampler.epoch_batches(inventory, batch_size, truncate, random_state, epoch)
+
+    def _records(self, positions):
+        """Return the records at the positions, a slice or array, of the
+        inventory."""
+        if self._positions is None:
+            return self._inventory.iloc[positions]
+
+        return self._inventory.iloc[self._positions[positions]]
+
+    def __view(self, columns):
+        """Return the columns of the inventory, without copying the other
+        columns of a shared inventory."""
+        if self._positions is None or columns is None:
+            return self.inventory
+
+        if columns not in self._views:
+            indexer = self._inventory.columns.get_indexer(columns)
+            if (indexer < 0).any():
+                raise KeyError("columns not in inventory: " + str(columns))
+            self._views[columns] = self._inventory.iloc[self._positions, indexer]
+
+        return self._views[columns]
+
+    def __set_inventory(self, inventory):
+        self._inventory = inventory
+        self._positions = None
+        self._views = {}
+
     def _clone_with_inventory(self, inventory):
         """Override to control the creation of new instances with modified inventory"""
         clone = copy.copy(self)
-        clone._inventory = inventory
+        clone.__set_inventory(inventory)
+
+        return clone
+
+    def _clone_with_positions(self, positions):
+        """Override to control the creation of new instances with the records
+        at the positions of the inventory, which share the inventory"""
+        clone = copy.copy(self)
+        clone._positions = positions if self._positions is None else self._positions[positions]
+        clone._views = {}
 
         return clone
 
     def __copy__(self):
         """Override to control cloning of the instance"""
-        return GeneratorDataSet(self._inventory, self._data_encoder, self._target_encoder)
+        data_set = GeneratorDataSet(self._inventory, self._data_encoder, self._target_encoder)
+        data_set._positions = self._positions
+        data_set._encoded_targets = self._encoded_targets
+        data_set._metrics = self._metrics
+
+        return data_set
+
+
+def _as_targets(targets):
+    """Convert the targets to a numpy array unless they are a scipy.sparse
+    matrix."""
+    return targets if hasattr(targets, 'tocsr') else np.array(targets)
+
+
+class BatchIterator:
+    """Iterator over the batches of a GeneratorDataSet that can be checkpointed
+    and resumed.
+
+    The state is the epoch and the number of batches of the epoch that were
+    returned, the random_state that determines the order of the records and the
+    prefetch settings. On resume the iterator continues with the next batch that
+    was not returned, batches that were only prefetched are generated again.
+    """
+    def __init__(self, generate, batch_size, epochs, truncate, random_state,
+            prefetch=0, workers=1, processes=0):
+        self._generate = generate
+        self._state = {
+            'epoch': 0,
+            'batch': 0,
+            'batch_size': batch_size,
+            'epochs': epochs,
+            'truncate': truncate,
+            'random_state': random_state,
+            'prefetch': prefetch,
+            'workers': workers,
+            'processes': processes }
+        self._positions = deque()
+        self._generator = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._generator is None:
+            self._positions.clear()
+            self._generator = self._generate(dict(self._state), self._positions)
+
+        batch = next(self._generator)
+        epoch, index = self._positions.popleft()
+        self._state['epoch'] = epoch
+        self._state['batch'] = index + 1
+
+        return batch
+
+    def state_dict(self):
+        return dict(self._state)
+
+    def load_state_dict(self, state):
+        for key in ('batch_size', 'epochs', 'truncate'):
+            if state[key] != self._state[key]:
+                raise ValueError(key + " of the state does not match: "
+                        + str(state[key]) + " != " + str(self._state[key]))
+
+        self.close()
+        self._state.update((key, state[key]) for key in
+                ('epoch', 'batch', 'random_state', 'prefetch', 'workers', 'processes'))
+
+    def close(self):
+        """Stop the background workers of the iterator, it can be resumed."""
+        if self._generator is not None:
+            self._generator.close()
+            self._generator = None
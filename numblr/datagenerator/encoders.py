@@ -3,16 +3,25 @@ logger = logging.getLogger()
 
 import os
 import io
+import sys
+import mmap
+import struct
+import tarfile
+import zipfile
+import threading
+from collections import OrderedDict
 from functools import reduce
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
-import sklearn.preprocessing as preprocessing
 
-try:
-    from urllib.parse import urljoin
-    import requests as http
-except ImportError as e:
-    logger.warning("Could not load dependencies for HTTP support", exc_info=True)
+from numblr.datagenerator.records import inventory_records
+from numblr.datagenerator.httpcache import HttpCache
+
+from urllib.parse import urljoin
+
+
+STAT_WORKERS = 16
 
 
 class BatchDataEncoder():
@@ -24,6 +33,13 @@ class BatchDataEncoder():
 
 
 class DataEncoder():
+    """Encoder for single records.
+
+    Set output_spec to a tuple (shape, dtype) of the encoded records to have
+    the batches assembled in a preallocated array.
+    """
+    output_spec = None
+
     def __call__(self, record):
         return self.transform(record)
 
@@ -36,6 +52,10 @@ class DataEncoder():
     def finalize_batch(self, records):
         return records
 
+    @property
+    def finalizes_batch(self):
+        return type(self).finalize_batch is not DataEncoder.finalize_batch
+
 
 class ResourceDataEncoder(DataEncoder):
     def get_path(self, record):
@@ -44,14 +64,52 @@ class ResourceDataEncoder(DataEncoder):
     def get_size(self, record):
         raise NotImplementedError()
 
+    def get_metadata(self, inventory, keys=('path', 'size')):
+        """Get the metadata of all records in the inventory in one pass.
+
+        Returns a dict with the values of each of the requested keys 'path' and
+        'size' as list aligned with the rows of the inventory.
+        """
+        records = inventory_records(inventory)
+        paths = [ self.get_path(record) for record in records ]
+
+        metadata = {}
+        if 'path' in keys:
+            metadata['path'] = paths
+        if 'size' in keys:
+            metadata['size'] = self._get_sizes(records, paths)
+
+        return metadata
+
+    def _get_sizes(self, records, paths):
+        """Override to customize bulk retrieval of the resource sizes"""
+        return [ self.get_size(record) for record in records ]
+
 
 class FileDataEncoder(ResourceDataEncoder):
+    """Encoder for records with data files.
+
+    The data_encoder is called with the open file of each record. With
+    mmap=True the file is memory-mapped instead and the data_encoder is called
+    with a read-only view on the mapped file without copying its content: a
+    memoryview by default, the array of .npy files, or a numpy.memmap with the
+    given dtype and shape if dtype is set. The mapping is kept open as long as
+    the view or any array created from it, e.g. by numpy.frombuffer, is
+    referenced.
+
+    With readahead=True the kernel is advised to read the files of the next
+    batch into the page cache while the current batch is encoded.
+    """
     def __init__(self,
             data_encoder=None,
             data_path=None,
             id_mapper=None,
             id='id',
-            binary=False):
+            binary=False,
+            mmap=False,
+            dtype=None,
+            shape=None,
+            readahead=False):
         if not callable(data_encoder):
             raise ValueError("data_encoder must be a callable" + str(type(data_encoder)))
         if not isinstance(data_path, str):
@@ -62,12 +120,20 @@ class FileDataEncoder(ResourceDataEncoder):
             raise ValueError("id must be a string" + str(type(id)))
         if not isinstance(binary, bool):
             raise ValueError("binary must be a boolean" + str(type(binary)))
+        if (dtype is not None or shape is not None) and not mmap:
+            raise ValueError("dtype and shape require mmap=True")
+        if shape is not None and dtype is None:
+            raise ValueError("shape requires a dtype")
 
         self._data_encoder = data_encoder
         self._data_path = data_path
         self._id_mapper = id_mapper
         self._id = id
         self._binary = binary
+        self._mmap = mmap
+        self._dtype = None if dtype is None else np.dtype(dtype)
+        self._shape = shape
+        self._readahead = readahead
 
     def fit(self, inventory):
         pass
@@ -75,7 +141,7 @@ class FileDataEncoder(ResourceDataEncoder):
     def get_path(self, record):
         id = record[self._id]
 
-        if self._id_mapper is None and data_path is None:
+        if self._id_mapper is None and self._data_path is None:
             return id
         elif self._id_mapper is None:
             return os.path.join(self._data_path, id)
@@ -85,36 +151,416 @@ class FileDataEncoder(ResourceDataEncoder):
     def get_size(self, record):
         return os.path.getsize(self.get_path(record))
 
+    def _get_sizes(self, records, paths):
+        """Collects the files in one os.scandir sweep of each directory and
+        stats them concurrently. The size of missing files is NaN."""
+        entries = self.__scan(paths)
+
+        with ThreadPoolExecutor(max_workers=STAT_WORKERS) as executor:
+            sizes = dict(zip(entries.keys(),
+                    executor.map(lambda entry: entry.stat().st_size, entries.values())))
+
+        if len(sizes) < len(set(paths)):
+            logger.warning("Files not found in %s: %s", self._data_path, len(set(paths)) - len(sizes))
+
+        return [ sizes.get(path, np.nan) for path in paths ]
+
+    def __scan(self, paths):
+        directories = {}
+        for path in paths:
+            directories.setdefault(os.path.dirname(path), set()).add(os.path.basename(path))
+
+        entries = {}
+        for directory, names in directories.items():
+            with os.scandir(directory or os.curdir) as scan:
+                entries.update((os.path.join(directory, entry.name), entry)
+                        for entry in scan if entry.name in names)
+
+        return entries
+
+    def locality_order(self, inventory):
+        """Return the positions of the records in the inventory ordered by
+        directory and inode of their files, which approximates the order of
+        the files on disk."""
+        paths = self.get_metadata(inventory, keys=('path',))['path']
+        entries = self.__scan(paths)
+
+        directories = np.array([ os.path.dirname(path) for path in paths ], dtype=object)
+        inodes = np.array([ entries[path].inode() if path in entries else -1 for path in paths ],
+                dtype=np.int64)
+        _, directory_order = np.unique(directories, return_inverse=True)
+
+        return np.lexsort((inodes, directory_order))
+
+    @property
+    def readahead(self):
+        return self._readahead and hasattr(os, 'posix_fadvise')
+
+    def advise_batch(self, inventory):
+        """Advise the kernel to read the files of the records in the
+        inventory."""
+        if not self.readahead:
+            return
+
+        for record in inventory_records(inventory):
+            try:
+                descriptor = os.open(self.get_path(record), os.O_RDONLY)
+            except OSError:
+                continue
+
+            try:
+                os.posix_fadvise(descriptor, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(descriptor)
+
     def transform(self, record):
+        if self._mmap:
+            return self._transform_data(self.__map(self.get_path(record)))
+
         mode = 'rb' if self._binary else 'r'
 
         with open(self.get_path(record), mode) as handle:
             return self._transform_data(handle)
 
+    def __map(self, path):
+        if self._dtype is not None:
+            return np.memmap(path, dtype=self._dtype, mode='r', shape=self._shape)
+        if path.endswith('.npy'):
+            return np.load(path, mmap_mode='r')
+
+        with open(path, 'rb') as handle:
+            if os.fstat(handle.fileno()).st_size == 0:
+                return memoryview(b'')
+
+            return memoryview(mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def _transform_data(self, data):
+        """Override to customize featurization"""
+        return self._data_encoder(data)
+
+    def finalize_batch(self, records):
+        try:
+            return self._data_encoder.finalize_batch(records)
+        except:
+            return records
+
+    @property
+    def finalizes_batch(self):
+        return type(self).finalize_batch is not FileDataEncoder.finalize_batch \
+                or hasattr(self._data_encoder, 'finalize_batch')
+
+    @property
+    def output_spec(self):
+        return getattr(self._data_encoder, 'output_spec', None)
+
+
+class ArchiveDataEncoder(ResourceDataEncoder):
+    """Encoder for records with data files that are members of uncompressed
+    tar or zip archives.
+
+    The offsets of the members in the archives are indexed once, when the
+    encoder is fitted or first used, and the members are read by offset from
+    the archives. The data_encoder is called with a file object of the member
+    like by the FileDataEncoder. The name of the member of a record is its id,
+    mapped by id_mapper if given. Use a LocalitySampler to read the records in
+    the order of the members in the archives. With readahead=True the kernel is
+    advised to read the members of the next batch while the current batch is
+    encoded.
+    """
+    ZIP_HEADER = struct.Struct('<4s2B4HL2L2H')
+
+    def __init__(self,
+            data_encoder=None,
+            archives=None,
+            id_mapper=None,
+            id='id',
+            binary=False,
+            readahead=False):
+        if not callable(data_encoder):
+            raise ValueError("data_encoder must be a callable" + str(type(data_encoder)))
+        if isinstance(archives, str):
+            archives = [archives]
+        if not archives or not all(isinstance(archive, str) for archive in archives):
+            raise ValueError("archives must be a path or a list of paths: " + str(archives))
+        if id_mapper is not None and not callable(id_mapper):
+            raise ValueError("id_mapper must be a callable" + str(type(id_mapper)))
+
+        self._data_encoder = data_encoder
+        self._archives = list(archives)
+        self._id_mapper = id_mapper
+        self._id = id
+        self._binary = binary
+        self._readahead = readahead
+        self._index = None
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_files'] = {}
+        del state['_lock']
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def index(self):
+        """The archive, offset and size of the members by name."""
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self.__create_index()
+
+        return self._index
+
+    def __create_index(self):
+        index = {}
+        for archive, path in enumerate(self._archives):
+            if zipfile.is_zipfile(path):
+                members = self.__zip_members(path)
+            else:
+                members = self.__tar_members(path)
+
+            index.update((name, (archive, offset, size)) for name, offset, size in members)
+
+        return index
+
+    def __tar_members(self, path):
+        try:
+            with tarfile.open(path, mode='r:') as archive:
+                return [ (member.name, member.offset_data, member.size)
+                        for member in archive.getmembers() if member.isfile() ]
+        except tarfile.ReadError as e:
+            raise ValueError("archive must be an uncompressed tar or zip file: " + path) from e
+
+    def __zip_members(self, path):
+        members = []
+        with zipfile.ZipFile(path) as archive, open(path, 'rb') as data:
+            for member in archive.infolist():
+                if member.is_dir():
+                    continue
+                if member.compress_type != zipfile.ZIP_STORED:
+                    raise ValueError("zip members must be stored uncompressed: " + member.filename)
+
+                data.seek(member.header_offset)
+                header = self.ZIP_HEADER.unpack(data.read(self.ZIP_HEADER.size))
+                offset = member.header_offset + self.ZIP_HEADER.size + header[-2] + header[-1]
+                members.append((member.filename, offset, member.file_size))
+
+        return members
+
+    def fit(self, inventory):
+        self.index
+
+    def get_member(self, record):
+        id = record[self._id]
+
+        return id if self._id_mapper is None else self._id_mapper(id)
+
+    def get_path(self, record):
+        member = self.get_member(record)
+        location = self.index.get(member)
+
+        return member if location is None else os.path.join(self._archives[location[0]], member)
+
+    def get_size(self, record):
+        return self.index[self.get_member(record)][2]
+
+    def _get_sizes(self, records, paths):
+        index = self.index
+        missing = object()
+        locations = [ index.get(self.get_member(record), missing) for record in records ]
+        if any(location is missing for location in locations):
+            logger.warning("Members not found in archives: %s",
+                    sum(location is missing for location in locations))
+
+        return [ np.nan if location is missing else location[2] for location in locations ]
+
+    def get_metadata(self, inventory, keys=('path', 'size')):
+        """Get the metadata of all records in the inventory, the keys 'archive'
+        and 'offset' give the location of the members in the archives."""
+        metadata = super(ArchiveDataEncoder, self).get_metadata(inventory,
+                keys=tuple(key for key in keys if key in ('path', 'size')))
+        if 'archive' in keys or 'offset' in keys:
+            locations = self.__locations(inventory)
+            if 'archive' in keys:
+                metadata['archive'] = list(locations[:, 0])
+            if 'offset' in keys:
+                metadata['offset'] = list(locations[:, 1])
+
+        return metadata
+
+    def locality_order(self, inventory):
+        """Return the positions of the records in the inventory ordered by
+        archive and offset."""
+        locations = self.__locations(inventory)
+
+        return np.lexsort((locations[:, 1], locations[:, 0]))
+
+    def __locations(self, inventory):
+        index = self.index
+        locations = [ index[self.get_member(record)][:2] for record in inventory_records(inventory) ]
+
+        return np.array(locations, dtype=np.int64).reshape(-1, 2)
+
+    @property
+    def readahead(self):
+        return self._readahead and hasattr(os, 'posix_fadvise')
+
+    def advise_batch(self, inventory):
+        """Advise the kernel to read the members of the records in the
+        inventory."""
+        if not self.readahead:
+            return
+
+        index = self.index
+        for record in inventory_records(inventory):
+            location = index.get(self.get_member(record))
+            if location is not None:
+                archive, offset, size = location
+                os.posix_fadvise(self.__file(archive), offset, size, os.POSIX_FADV_WILLNEED)
+
+    def transform(self, record):
+        archive, offset, size = self.index[self.get_member(record)]
+        data = os.pread(self.__file(archive), size, offset)
+
+        handle = io.BytesIO(data)
+        return self._transform_data(handle if self._binary else io.TextIOWrapper(handle))
+
+    def __file(self, archive):
+        descriptor = self._files.get(archive)
+        if descriptor is None:
+            with self._lock:
+                descriptor = self._files.get(archive)
+                if descriptor is None:
+                    descriptor = self._files[archive] = os.open(self._archives[archive], os.O_RDONLY)
+
+        return descriptor
+
     def _transform_data(self, data):
         """Override to customize featurization"""
         return self._data_encoder(data)
 
+    def close(self):
+        with self._lock:
+            for descriptor in self._files.values():
+                os.close(descriptor)
+            self._files = {}
+
     def finalize_batch(self, records):
         try:
             return self._data_encoder.finalize_batch(records)
         except:
             return records
 
+    @property
+    def finalizes_batch(self):
+        return type(self).finalize_batch is not ArchiveDataEncoder.finalize_batch \
+                or hasattr(self._data_encoder, 'finalize_batch')
+
+    @property
+    def output_spec(self):
+        return getattr(self._data_encoder, 'output_spec', None)
+
+
 class UrlDataEncoder(ResourceDataEncoder):
+    """Data encoder for resources loaded by HTTP.
+
+    Resources are loaded with a session that keeps up to concurrency pooled
+    connections alive. transform_batch loads the resources of a batch with up
+    to concurrency parallel requests. Failed requests and responses with a
+    server error status are retried up to retries times with exponential
+    backoff, timeout limits the time to connect and to wait for data in
+    seconds.
+
+    With cache, an HttpCache or the path of a directory for one, the responses
+    are stored on disk and later epochs and runs load them from there instead
+    of the network, see HttpCache for expiry and revalidation.
+    """
+    RETRY_STATUS = (500, 502, 503, 504)
+
     def __init__(self,
             data_encoder=None,
             base_url=None,
             id_mapper=None,
             headers=None,
             type = 'text',
-            id='id'):
+            id='id',
+            concurrency=8,
+            timeout=None,
+            retries=0,
+            backoff=0.1,
+            cache=None):
+        if not isinstance(concurrency, int) or concurrency < 1:
+            raise ValueError("concurrency must be a positive integer: " + str(concurrency))
+        if not isinstance(retries, int) or retries < 0:
+            raise ValueError("retries must be a non-negative integer: " + str(retries))
+
         self._data_encoder = data_encoder
         self._base_url = base_url
         self._headers = headers
         self._id_mapper = id_mapper
         self._id = id
         self._type = type
+        self._concurrency = concurrency
+        self._timeout = timeout
+        self._retries = retries
+        self._backoff = backoff
+        self._cache = HttpCache(cache) if isinstance(cache, str) else cache
+        self._session = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_session'] = None
+        del state['_lock']
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        session = self._session
+        if session is None:
+            with self._lock:
+                session = self._session
+                if session is None:
+                    session = self._session = self._create_session()
+
+        return session
+
+    def _create_session(self):
+        """Override to customize the HTTP session"""
+        import requests as http
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(total=self._retries, backoff_factor=self._backoff,
+                status_forcelist=self.RETRY_STATUS, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=self._concurrency,
+                pool_maxsize=self._concurrency, max_retries=retry)
+
+        session = http.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        return session
+
+    @property
+    def cache(self):
+        return self._cache
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
 
     def fit(self, inventory):
         pass
@@ -122,7 +568,7 @@ class UrlDataEncoder(ResourceDataEncoder):
     def get_path(self, record):
         id = record[self._id]
 
-        if self._id_mapper is None and data_path is None:
+        if self._id_mapper is None and self._base_url is None:
             return id
         elif self._id_mapper is None:
             return urljoin(self._base_url, id)
@@ -130,13 +576,29 @@ class UrlDataEncoder(ResourceDataEncoder):
             return urljoin(self._base_url, self._id_mapper(id))
 
     def get_size(self, record):
-        request = http.head(self.get_path(record), headers=self._headers)
+        return self.__get_content_length(self.get_path(record))
+
+    def _get_sizes(self, records, paths):
+        """Sends up to concurrency HEAD requests in parallel."""
+        if self._concurrency == 1 or len(paths) < 2:
+            return [ self.__get_content_length(path) for path in paths ]
+
+        with ThreadPoolExecutor(max_workers=min(self._concurrency, len(paths))) as executor:
+            return list(executor.map(self.__get_content_length, paths))
+
+    def __get_content_length(self, url):
+        request = self.session.head(url, headers=self._headers, timeout=self._timeout)
         request.raise_for_status()
 
         return int(request.headers.get('content-length'))
 
     def transform(self, record):
-        request = http.get(self.get_path(record), headers=self._headers)
+        if self._cache is None:
+            request = self.session.get(self.get_path(record),
+                    headers=self._headers, timeout=self._timeout)
+        else:
+            request = self._cache.get(self.session, self.get_path(record),
+                    headers=self._headers, timeout=self._timeout)
         request.raise_for_status()
 
         if self._type == 'text':
@@ -148,6 +610,14 @@ class UrlDataEncoder(ResourceDataEncoder):
 
         return self._transform_data(data)
 
+    def transform_batch(self, records):
+        records = list(records)
+        if self._concurrency == 1 or len(records) < 2:
+            return [ self.transform(record) for record in records ]
+
+        with ThreadPoolExecutor(max_workers=min(self._concurrency, len(records))) as executor:
+            return list(executor.map(self.transform, records))
+
     def _transform_data(self, data):
         """Override to customize featurization"""
         return self._data_encoder(data)
@@ -159,6 +629,155 @@ class UrlDataEncoder(ResourceDataEncoder):
             return records
 
 
+class PaddingDataEncoder(DataEncoder):
+    """Pads the encoded records of each batch along the first axis to the
+    length of the longest record in the batch.
+
+    Best combined with a BucketSampler that batches records of similar size.
+    """
+    def __init__(self, data_encoder=None, value=0, dtype=None):
+        if not callable(data_encoder) and not hasattr(data_encoder, 'transform'):
+            raise ValueError("data_encoder must be a callable or encoder" + str(type(data_encoder)))
+
+        self._data_encoder = data_encoder
+        self._value = value
+        self._dtype = dtype
+
+    def fit(self, inventory):
+        if hasattr(self._data_encoder, 'fit'):
+            self._data_encoder.fit(inventory)
+
+    def transform(self, record):
+        if hasattr(self._data_encoder, 'transform'):
+            return self._data_encoder.transform(record)
+        else:
+            return self._data_encoder(record)
+
+    def finalize_batch(self, records):
+        if hasattr(self._data_encoder, 'finalize_batch'):
+            records = self._data_encoder.finalize_batch(records)
+
+        records = [ np.asarray(record) for record in records ]
+        if not records:
+            return np.empty((0, 0), dtype=self._dtype)
+
+        length = max(len(record) for record in records)
+        dtype = self._dtype if self._dtype is not None else np.result_type(*records)
+
+        batch = np.full((len(records), length) + records[0].shape[1:], self._value, dtype=dtype)
+        for position, record in enumerate(records):
+            batch[position, :len(record)] = record
+
+        return batch
+
+
+class CachingDataEncoder(DataEncoder):
+    """Caches the encoded records of a data encoder by the id of the records.
+
+    The most recently used encoded records are kept up to a total size of
+    max_bytes, the size of numpy arrays is their nbytes. The cache is thread
+    safe, the cached records are returned as is and must not be modified.
+    Worker processes each have a cache of their own.
+    """
+    def __init__(self, data_encoder=None, max_bytes=2**30, id='id'):
+        if not callable(data_encoder) and not hasattr(data_encoder, 'transform'):
+            raise ValueError("data_encoder must be a callable or encoder" + str(type(data_encoder)))
+        if max_bytes < 0:
+            raise ValueError("max_bytes must not be negative: " + str(max_bytes))
+
+        self._data_encoder = data_encoder
+        self._max_bytes = max_bytes
+        self._id = id
+        self._lock = threading.Lock()
+        self.clear()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_cache'] = OrderedDict()
+        state['_cached_bytes'] = 0
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    @property
+    def cached_bytes(self):
+        return self._cached_bytes
+
+    def clear(self):
+        with self._lock:
+            self._cache = OrderedDict()
+            self._cached_bytes = 0
+            self._hits = 0
+            self._misses = 0
+
+    def fit(self, inventory):
+        if hasattr(self._data_encoder, 'fit'):
+            self._data_encoder.fit(inventory)
+
+    def transform(self, record):
+        key = record[self._id]
+
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self._hits += 1
+
+                return self._cache[key][0]
+
+            self._misses += 1
+
+        if hasattr(self._data_encoder, 'transform'):
+            data = self._data_encoder.transform(record)
+        else:
+            data = self._data_encoder(record)
+
+        self.__add(key, data)
+
+        return data
+
+    def __add(self, key, data):
+        size = getattr(data, 'nbytes', None) or sys.getsizeof(data)
+        if size > self._max_bytes:
+            return
+
+        with self._lock:
+            if key in self._cache:
+                return
+
+            self._cache[key] = (data, size)
+            self._cached_bytes += size
+            while self._cached_bytes > self._max_bytes:
+                _, (_, evicted_size) = self._cache.popitem(last=False)
+                self._cached_bytes -= evicted_size
+
+    def finalize_batch(self, records):
+        if hasattr(self._data_encoder, 'finalize_batch'):
+            return self._data_encoder.finalize_batch(records)
+        else:
+            return records
+
+    @property
+    def finalizes_batch(self):
+        return getattr(self._data_encoder, 'finalizes_batch',
+                hasattr(self._data_encoder, 'finalize_batch'))
+
+    @property
+    def output_spec(self):
+        return getattr(self._data_encoder, 'output_spec', None)
+
+
 
 class IdentityEncoder:
     def fit(self, data):
@@ -175,25 +794,72 @@ class IdentityEncoder:
 
 
 class IntToOneHotEncoder:
-    def __init__(self, sparse=False, n_values='auto', handle_unknown='ingore'):
-        self._encoder = OneHotEncoder(sparse=sparse, n_values=n_values, handle_unknown=handle_unknown)
+    """One-hot encoder for integer values, e.g. the labels of a LabelEncoder.
+
+    With n_values='auto' the number of values is the maximum value seen by fit
+    plus one. The encoded values are returned as numpy array of the given dtype,
+    or as scipy.sparse.csr_matrix with sparse=True. With handle_unknown='ignore'
+    values outside of range(n_values) are encoded to all zeros, with
+    handle_unknown='error' a ValueError is raised instead.
+    """
+    def __init__(self, sparse=False, n_values='auto', handle_unknown='ignore', dtype=np.float64):
+        if n_values != 'auto' and (not isinstance(n_values, (int, np.integer)) or n_values < 1):
+            raise ValueError("n_values must be 'auto' or a positive integer: " + str(n_values))
+        if handle_unknown not in ('ignore', 'error'):
+            raise ValueError("handle_unknown must be 'ignore' or 'error': " + str(handle_unknown))
+
+        self._sparse = sparse
+        self._n_values = n_values
+        self._handle_unknown = handle_unknown
+        self._dtype = np.dtype(dtype)
+        self.n_values_ = None if n_values == 'auto' else int(n_values)
 
     def fit(self, data):
-        self._encoder.fit(self.__reshape(data))
+        if self._n_values == 'auto':
+            data = self.__values(data)
+            self.n_values_ = int(data.max()) + 1 if len(data) > 0 else 0
+
+        return self
 
     def fit_transform(self, data):
-        return self._encoder.fit_transform(self.__reshape(data))
+        return self.fit(data).transform(data)
 
     def transform(self, data):
-        return self._encoder.transform(self.__reshape(data))
+        if self.n_values_ is None:
+            raise ValueError("IntToOneHotEncoder is not fitted")
+
+        data = self.__values(data)
+        known = (data >= 0) & (data < self.n_values_)
+        if self._handle_unknown == 'error' and not known.all():
+            raise ValueError("values out of range(" + str(self.n_values_) + "): "
+                    + str(np.unique(data[~known])))
+
+        rows = np.flatnonzero(known)
+        if self._sparse:
+            from scipy.sparse import csr_matrix
+
+            return csr_matrix((np.ones(len(rows), dtype=self._dtype), (rows, data[rows])),
+                    shape=(len(data), self.n_values_))
+
+        encoded = np.zeros((len(data), self.n_values_), dtype=self._dtype)
+        encoded[rows, data[rows]] = 1
+
+        return encoded
 
     def inverse_transform(self, data):
+        if hasattr(data, 'tocsr'):
+            return np.asarray(data.argmax(axis=1)).flatten()
+
         data = np.array(data, copy=False)
 
         return np.argmax(data, axis=1).flatten()
 
-    def __reshape(self, data):
-        return data.reshape(len(data), 1)
+    def __values(self, data):
+        data = np.asarray(data).reshape(-1)
+        if len(data) > 0 and not np.issubdtype(data.dtype, np.integer):
+            raise ValueError("IntToOneHotEncoder requires integer values: " + str(data.dtype))
+
+        return data.astype(np.intp, copy=False)
 
 
 class RecordTargetEncoder:
@@ -236,6 +902,19 @@ class RecordTargetEncoder:
 
         return reduce(lambda x, enc: enc.transform(x), self._delegates, target_data)
 
+    def compact_transform(self, records):
+        """Transform the targets with all but the last of several encoders, e.g.
+        to the labels of a LabelEncoder before they are one-hot encoded. With a
+        single encoder this is the transform."""
+        target_data = self.get_target_data(records)
+        delegates = self._delegates[:-1] if len(self._delegates) > 1 else self._delegates
+
+        return reduce(lambda x, enc: enc.transform(x), delegates, target_data)
+
+    def expand(self, target_data):
+        """Transform the result of compact_transform with the last encoder."""
+        return self._delegates[-1].transform(target_data) if len(self._delegates) > 1 else target_data
+
     def inverse_transform(self, target_data):
         target_data = np.array(target_data, copy=False)
         return reduce(lambda x, enc: enc.inverse_transform(x), self._delegates[::-1], target_data)
@@ -246,7 +925,9 @@ class RecordTargetEncoder:
 
 class LabelRecordEncoder(RecordTargetEncoder):
     def __init__(self, target='target'):
-        super(LabelRecordEncoder, self).__init__(LabelEncoder())
+        from sklearn.preprocessing import LabelEncoder
+
+        super(LabelRecordEncoder, self).__init__(LabelEncoder(), target)
 
     @property
     def classes_(self):
@@ -254,13 +935,23 @@ class LabelRecordEncoder(RecordTargetEncoder):
 
 
 class OneHotRecordEncoder(RecordTargetEncoder):
-    def __init__(self, target='target'):
-        super(OneHotRecordEncoder, self).__init__([LabelEncoder(), IntToOneHotEncoder()])
+    def __init__(self, target='target', sparse=False, dtype=np.float64):
+        from sklearn.preprocessing import LabelEncoder
+
+        super(OneHotRecordEncoder, self).__init__(
+                [LabelEncoder(), IntToOneHotEncoder(sparse=sparse, dtype=dtype)], target)
 
     @property
     def classes_(self):
         return self._delegates[0].classes_
 
 
-LabelEncoder = preprocessing.LabelEncoder
-OneHotEncoder = preprocessing.OneHotEncoder
+def __getattr__(name):
+    """Provide the LabelEncoder and OneHotEncoder of scikit-learn, such that
+    scikit-learn is only imported if they are used."""
+    if name in ('LabelEncoder', 'OneHotEncoder'):
+        import sklearn.preprocessing as preprocessing
+
+        return getattr(preprocessing, name)
+
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
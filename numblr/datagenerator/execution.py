@@ -0,0 +1,256 @@
+import logging
+import queue
+import threading
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+
+logger = logging.getLogger()
+
+
+CHUNKS_PER_PROCESS = 4
+
+
+def prefetch(function, items, size=1, workers=1, monitor=None):
+    """Generate function(item) for all items, computed ahead on a thread pool.
+
+    At most size results are computed ahead of the consumer. Results are
+    generated in the order of items and exceptions raised by function are
+    re-raised when the respective result is requested. If given, monitor is
+    called with the number of results that are ready whenever the next result
+    is requested.
+    """
+    if size < 1:
+        raise ValueError("prefetch size must be at least 1: " + str(size))
+    if workers < 1:
+        raise ValueError("number of workers must be at least 1: " + str(workers))
+
+    return _prefetch(function, iter(items), size, workers, monitor)
+
+
+def _prefetch(function, items, size, workers, monitor):
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        pending.extend(executor.submit(function, item) for item in islice(items, size))
+        while pending:
+            if monitor is not None:
+                monitor(sum(1 for future in pending if future.done()))
+
+            result = pending.popleft().result()
+            pending.extend(executor.submit(function, item) for item in islice(items, 1))
+
+            yield result
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+class ProcessPool:
+    """Pool of worker processes that encode records with the data encoders of
+    a data set.
+
+    The data set is sent to each worker process once at startup, hence it
+    should not carry a large inventory. The records of a batch are split into
+    chunks that are encoded in parallel and the results are returned in the
+    order of the records.
+
+    With slots > 0 the workers write the encoded records into a ring of shared
+    memory slots per encoder, sized for batch_size records, or the length of
+    the first batch if it is larger, with the record shape and dtype declared
+    by the output_spec of the encoder or else of the first batch, and the
+    encoded batch is a view on the slot. Batches with records that can not be
+    cast safely to the dtype of the slots are returned as lists of records
+    instead. Slots are only used within function calls wrapped by leasing()
+    and are held until the lease returned with the result is released.
+    """
+    def __init__(self, data_set, processes, slots=0, batch_size=None):
+        if processes < 1:
+            raise ValueError("number of processes must be at least 1: " + str(processes))
+
+        self._data_set = data_set
+        self._processes = processes
+        self._slots = slots
+        self._batch_size = batch_size
+        self._rings = {}
+        self._rings_lock = threading.Lock()
+        self._local = threading.local()
+
+        if slots > 0:
+            # Share the resource tracker of the shared memory with the workers
+            resource_tracker.ensure_running()
+
+        self._executor = ProcessPoolExecutor(max_workers=processes,
+                initializer=_initialize_worker, initargs=(data_set,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def leasing(self, function):
+        """Wrap function to return its result with the lease on the shared
+        memory slots that were used to compute it."""
+        def leased(*args, **kwargs):
+            lease = self._local.lease = Lease()
+            try:
+                return function(*args, **kwargs), lease
+            except:
+                lease.release()
+                raise
+            finally:
+                self._local.lease = None
+
+        return leased
+
+    def encode(self, encoder_index, records):
+        lease = getattr(self._local, 'lease', None)
+        ring = self._rings.get(encoder_index)
+
+        if lease is None or ring is None or len(records) > ring.length:
+            data = self.__encode(_encode_records, encoder_index, records)
+            if lease is not None and encoder_index not in self._rings:
+                self.__create_ring(encoder_index, data)
+
+            return data
+
+        memory = ring.acquire()
+        lease.add(ring, memory)
+        batch = ring.view(memory, len(records))
+        chunks = self.__encode_chunks(_encode_records_into, encoder_index, records,
+                memory.name, ring.shape, ring.dtype)
+        if all(chunk is None for _, chunk in chunks):
+            return batch
+
+        return [ data for part, chunk in chunks
+                for data in (batch[part].copy() if chunk is None else chunk) ]
+
+    def __encode(self, encode, encoder_index, records, *args):
+        chunks = [ chunk for _, chunk in self.__encode_chunks(encode, encoder_index, records, *args) ]
+        if chunks and all(isinstance(chunk, np.ndarray) and chunk.ndim > 0 for chunk in chunks) \
+                and len({ chunk.shape[1:] for chunk in chunks }) == 1:
+            return np.concatenate(chunks)
+
+        return [ data for chunk in chunks for data in chunk ]
+
+    def __encode_chunks(self, encode, encoder_index, records, *args):
+        """Return the slices of the records with the encoded chunks."""
+        chunk_size = max(1, -(-len(records) // (self._processes * CHUNKS_PER_PROCESS)))
+
+        futures = [ (slice(i, i + chunk_size),
+                self._executor.submit(encode, encoder_index, records[i:i + chunk_size], i, *args))
+                for i in range(0, len(records), chunk_size) ]
+
+        return [ (part, future.result()) for part, future in futures ]
+
+    def __create_ring(self, encoder_index, data):
+        with self._rings_lock:
+            if encoder_index in self._rings:
+                return
+
+            data = np.asarray(data)
+            output_spec = self._data_set._output_spec(encoder_index)
+            if output_spec is not None:
+                shape, dtype = tuple(output_spec[0]), np.dtype(output_spec[1])
+            else:
+                shape, dtype = data.shape[1:], data.dtype
+
+            if self._slots > 0 and data.ndim > 0 and dtype != np.object_:
+                length = max(len(data), self._batch_size or 0)
+                self._rings[encoder_index] = SharedMemoryRing((length,) + shape, dtype, self._slots)
+            else:
+                self._rings[encoder_index] = None
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+        for ring in self._rings.values():
+            if ring is not None:
+                ring.close()
+
+
+class SharedMemoryRing:
+    """Ring of shared memory slots, each holding an array of the given shape
+    and dtype."""
+    def __init__(self, shape, dtype, slots):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._free = queue.Queue()
+        self._memory = [ SharedMemory(create=True, size=max(1, int(np.prod(shape)) * self.dtype.itemsize))
+                for _ in range(slots) ]
+
+        for memory in self._memory:
+            self._free.put(memory)
+
+    @property
+    def length(self):
+        return self.shape[0]
+
+    def acquire(self):
+        """Get a free slot, blocks until a slot is released."""
+        return self._free.get()
+
+    def release(self, memory):
+        self._free.put(memory)
+
+    def view(self, memory, length=None):
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=memory.buf)[:length]
+
+    def close(self):
+        for memory in self._memory:
+            memory.unlink()
+            try:
+                memory.close()
+            except BufferError:
+                logger.debug("Shared memory %s is still in use", memory.name)
+
+
+class Lease:
+    """Shared memory slots held for a result."""
+    def __init__(self):
+        self._slots = []
+
+    def add(self, ring, memory):
+        self._slots.append((ring, memory))
+
+    def release(self):
+        for ring, memory in self._slots:
+            ring.release(memory)
+
+        self._slots = []
+
+
+_worker_data_set = None
+_worker_memory = {}
+
+
+def _initialize_worker(data_set):
+    global _worker_data_set
+    _worker_data_set = data_set
+
+
+def _encode_records(encoder_index, records, offset):
+    """Return the encoded chunk as one array if it was encoded into an array,
+    to send a single object back to the parent process."""
+    data = _worker_data_set._encode_records(encoder_index, records)
+
+    return data if isinstance(data, np.ndarray) else list(data)
+
+
+def _encode_records_into(encoder_index, records, offset, name, shape, dtype):
+    """Encode the chunk directly into its part of the shared memory slot, or
+    return the encoded records if they can not be cast safely into it."""
+    if name not in _worker_memory:
+        _worker_memory[name] = SharedMemory(name=name)
+
+    target = np.ndarray(shape, dtype=dtype, buffer=_worker_memory[name].buf)[offset:offset + len(records)]
+    data = _worker_data_set._encode_records(encoder_index, records, target)
+
+    return None if data is target else list(data)
@@ -1,17 +1,28 @@
+import os
 import logging
 import copy
+import pickle
+import hashlib
+import tempfile
 
 import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
 
 from numblr.datagenerator.dataset import GeneratorDataSet
-from numblr.datagenerator.encoders import FileDataEncoder, UrlDataEncoder, RecordTargetEncoder
+from numblr.datagenerator.encoders import (FileDataEncoder, UrlDataEncoder, ArchiveDataEncoder,
+        RecordTargetEncoder)
+from numblr.datagenerator import shards
+from numblr.datagenerator.shards import ShardDataEncoder, ShardTargetEncoder
 
 
 logger = logging.getLogger()
 
 
+META_SUFFIX = '.meta'
+META_TEMPORARY_PREFIX = '.meta-'
+HASH_CHUNK_SIZE = 2**20
+
+
 inventory_from_csv = pd.read_csv
 inventory_from_records = pd.DataFrame.from_records
 inventory_from_dict = pd.DataFrame.from_dict
@@ -19,10 +30,15 @@ inventory_from_items = pd.DataFrame.from_items
 
 def enrich_inventory(inventory, resource_encoder, id='id', include_meta={'size': 'size'}):
     try:
-        if 'size' in include_meta.keys():
-            inventory[include_meta['size']] = inventory.apply(resource_encoder.get_size, axis=1)
-        if 'path' in include_meta.keys():
-            inventory[include_meta['path']] = inventory.apply(resource_encoder.get_path, axis=1)
+        if hasattr(resource_encoder, 'get_metadata'):
+            metadata = resource_encoder.get_metadata(inventory, keys=tuple(include_meta.keys()))
+            for key, column in include_meta.items():
+                inventory[column] = metadata[key]
+        else:
+            if 'size' in include_meta.keys():
+                inventory[include_meta['size']] = inventory.apply(resource_encoder.get_size, axis=1)
+            if 'path' in include_meta.keys():
+                inventory[include_meta['path']] = inventory.apply(resource_encoder.get_path, axis=1)
     except:
         logger.warning("Failed to enrich inventory with metadata")
 
@@ -32,15 +48,134 @@ def enrich_inventory(inventory, resource_encoder, id='id', include_meta={'size':
 
 
 def generator_for_files(inventory_path, data_path, data_encoder, target_encoder,
-        id_mapper=None, id='id', target='target', binary=False):
+        id_mapper=None, id='id', target='target', binary=False, cache_metadata=False):
+    """Create a data set for the files of the records in the inventory.
+
+    With cache_metadata=True the file sizes and the fitted target encoder are
+    stored in a sidecar file next to the inventory (inventory_path + '.meta')
+    and reused as long as neither the inventory file, the paths of the data
+    files, the files in their directories nor the parameters of the target
+    encoder change. The target encoder must be picklable.
+    """
     file_data_encoder = FileDataEncoder(data_encoder, data_path,
             id=id, id_mapper=id_mapper, binary=binary)
     record_target_encoder = RecordTargetEncoder(target_encoder, target)
-    inventory = enrich_inventory(pd.read_csv(inventory_path), file_data_encoder, id)
+    inventory = pd.read_csv(inventory_path)
+
+    key = None
+    if cache_metadata:
+        sidecar_path = inventory_path + META_SUFFIX
+        key = _metadata_key(inventory_path, sidecar_path, inventory, file_data_encoder,
+                target_encoder, id, target)
+    if key is not None:
+        cached = _read_metadata(sidecar_path, key)
+        if cached is not None:
+            inventory['size'] = cached['size']
+            inventory.set_index(id, drop=False, inplace=True, verify_integrity=True)
+
+            data_set = GeneratorDataSet(inventory, file_data_encoder, cached['target_encoder'])
+            data_set.encode_targets()
+
+            return data_set
+
+    inventory = enrich_inventory(inventory, file_data_encoder, id)
 
     data_set = GeneratorDataSet(inventory, file_data_encoder, record_target_encoder)
     data_set.fit_encoders()
 
+    if key is not None and 'size' not in inventory:
+        logger.warning("Metadata is not cached, the inventory was not enriched with the file sizes")
+    elif key is not None:
+        _write_metadata(sidecar_path, {
+            'key': key,
+            'size': inventory['size'].to_numpy(),
+            'target_encoder': record_target_encoder })
+
+    return data_set
+
+
+def _metadata_key(inventory_path, sidecar_path, inventory, resource_encoder, target_encoder, id, target):
+    """Return the key of the metadata of the inventory, or None if the target
+    encoder can not be pickled."""
+    try:
+        encoder_digest = hashlib.sha256(pickle.dumps(target_encoder,
+                protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+    except Exception:
+        logger.warning("Metadata is not cached, the target encoder can not be pickled", exc_info=True)
+        return None
+
+    digest = hashlib.sha256()
+    with open(inventory_path, 'rb') as inventory_file:
+        for chunk in iter(lambda: inventory_file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+
+    paths = list(resource_encoder.get_metadata(inventory, keys=('path',))['path'])
+    paths_digest = hashlib.sha256('\n'.join(paths).encode('utf-8')).hexdigest()
+    directories = sorted({ os.path.dirname(path) or os.curdir for path in paths })
+    signatures = [ (directory, _directory_signature(directory, sidecar_path)) for directory in directories ]
+
+    return (digest.hexdigest(), paths_digest, signatures, id, target, encoder_digest)
+
+
+def _directory_signature(directory, sidecar_path):
+    """Return the modification time of the directory, or for the directory of
+    the sidecar, whose mtime changes with every write of the sidecar, a digest
+    of the names of the other files in it."""
+    if not os.path.isdir(directory):
+        return None
+
+    sidecar_directory = os.path.dirname(sidecar_path) or os.curdir
+    if not os.path.samefile(directory, sidecar_directory):
+        return os.stat(directory).st_mtime_ns
+
+    sidecar_name = os.path.basename(sidecar_path)
+    names = sorted(name for name in os.listdir(directory)
+            if name != sidecar_name and not name.startswith(META_TEMPORARY_PREFIX))
+
+    return hashlib.sha256('\n'.join(names).encode('utf-8')).hexdigest()
+
+
+def _read_metadata(path, key):
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, 'rb') as sidecar:
+            metadata = pickle.load(sidecar)
+    except Exception:
+        logger.warning("Failed to read metadata cache %s", path, exc_info=True)
+        return None
+
+    return metadata if isinstance(metadata, dict) and metadata.get('key') == key else None
+
+
+def _write_metadata(path, metadata):
+    """Write the metadata to a temporary file that replaces the sidecar, such
+    that concurrent processes never read a partially written sidecar."""
+    directory = os.path.dirname(path) or os.curdir
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix=META_TEMPORARY_PREFIX)
+    try:
+        with os.fdopen(descriptor, 'wb') as sidecar:
+            pickle.dump(metadata, sidecar, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+    except Exception:
+        logger.warning("Failed to write metadata cache %s", path, exc_info=True)
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def generator_for_archives(inventory_path, archives, data_encoder, target_encoder,
+        id_mapper=None, id='id', target='target', binary=False):
+    """Create a data set for records with data files that are members of
+    uncompressed tar or zip archives, see ArchiveDataEncoder."""
+    archive_data_encoder = ArchiveDataEncoder(data_encoder, archives,
+            id=id, id_mapper=id_mapper, binary=binary)
+    record_target_encoder = RecordTargetEncoder(target_encoder, target)
+    inventory = enrich_inventory(pd.read_csv(inventory_path), archive_data_encoder, id)
+
+    data_set = GeneratorDataSet(inventory, archive_data_encoder, record_target_encoder)
+    data_set.fit_encoders()
+
     return data_set
 
 
@@ -55,3 +190,16 @@ def generator_for_urls(inventory_path, base_url,
     data_set.fit_encoders()
 
     return data_set
+
+
+def generator_for_shards(path):
+    """Load a data set that was written by GeneratorDataSet.materialize."""
+    meta = shards.read_meta(path)
+    inventory = pd.read_csv(os.path.join(path, shards.INDEX_FILE))
+
+    data_encoders = [ ShardDataEncoder(path, index) for index in range(meta['data']) ]
+    target_encoder = ShardTargetEncoder(path) if meta['targets'] else None
+
+    return GeneratorDataSet(inventory,
+            data_encoders if len(data_encoders) > 1 else data_encoders[0],
+            target_encoder)
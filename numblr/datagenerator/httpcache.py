@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+import logging
+logger = logging.getLogger()
+
+
+BODY_SUFFIX = '.body'
+META_SUFFIX = '.json'
+
+
+class HttpCache:
+    """On-disk cache of HTTP responses by URL for the UrlDataEncoder.
+
+    The bodies of successful responses are stored in the directory path
+    together with their ETag and Last-Modified headers. A cached response is
+    used without request as long as it is younger than ttl seconds, or forever
+    if ttl is None. With revalidate=True, or once the ttl expired, the cached
+    response is revalidated with a conditional request and only downloaded
+    again if it changed. If the bodies exceed max_bytes, the least recently
+    used responses are evicted.
+    """
+    def __init__(self, path, max_bytes=2**30, ttl=None, revalidate=False):
+        if max_bytes < 0:
+            raise ValueError("max_bytes must not be negative: " + str(max_bytes))
+        if ttl is not None and ttl < 0:
+            raise ValueError("ttl must not be negative: " + str(ttl))
+
+        os.makedirs(path, exist_ok=True)
+
+        self._path = path
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._revalidate = revalidate
+        self._lock = threading.Lock()
+        self._size = None
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_size'] = None
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        """The total size of the cached bodies in bytes."""
+        with self._lock:
+            return self.__size()
+
+    def get(self, session, url, headers=None, timeout=None):
+        """Return the response for the url from the cache, or from a request
+        with the session that is then cached."""
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        meta = self.__read_meta(key)
+
+        if meta is not None and not self._revalidate \
+                and (self._ttl is None or time.time() - meta['time'] < self._ttl):
+            response = self.__read(key, meta)
+            if response is not None:
+                self.__count('hits')
+                return response
+
+        request_headers = dict(headers or {})
+        if meta is not None:
+            if meta.get('etag'):
+                request_headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                request_headers['If-Modified-Since'] = meta['last_modified']
+
+        response = session.get(url, headers=request_headers, timeout=timeout)
+        if response.status_code == 304 and meta is not None:
+            cached = self.__read(key, meta)
+            if cached is not None:
+                self.__count('revalidations')
+                meta['time'] = time.time()
+                self.__write_meta(key, meta)
+                return cached
+
+            response = session.get(url, headers=headers, timeout=timeout)
+
+        response.raise_for_status()
+        self.__count('misses')
+        if response.status_code == 200:
+            self.__store(key, url, response)
+
+        return response
+
+    def clear(self):
+        with self._lock:
+            for name in os.listdir(self._path):
+                if name.endswith(BODY_SUFFIX) or name.endswith(META_SUFFIX):
+                    self.__remove(os.path.join(self._path, name))
+            self._size = 0
+
+    def __count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def __read(self, key, meta):
+        body_path = self.__file(key, BODY_SUFFIX)
+        try:
+            with open(body_path, 'rb') as body:
+                content = body.read()
+            os.utime(body_path)
+        except OSError:
+            return None
+
+        return CachedResponse(meta['url'], content, meta.get('encoding'))
+
+    def __read_meta(self, key):
+        try:
+            with open(self.__file(key, META_SUFFIX)) as meta:
+                return json.load(meta)
+        except (OSError, ValueError):
+            return None
+
+    def __store(self, key, url, response):
+        content = response.content
+        if len(content) > self._max_bytes:
+            return
+
+        meta = {
+            'url': url,
+            'time': time.time(),
+            'size': len(content),
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'encoding': response.encoding or response.apparent_encoding }
+
+        with self._lock:
+            self.__size()
+            previous = self.__read_meta(key)
+            self.__write(self.__file(key, BODY_SUFFIX), content)
+            self.__write_meta(key, meta)
+
+            self._size += len(content) - (previous['size'] if previous is not None else 0)
+            if self._size > self._max_bytes:
+                self.__evict()
+
+    def __write_meta(self, key, meta):
+        self.__write(self.__file(key, META_SUFFIX), json.dumps(meta).encode('utf-8'))
+
+    def __write(self, path, content):
+        descriptor, temporary_path = tempfile.mkstemp(dir=self._path, prefix='.tmp-')
+        try:
+            with os.fdopen(descriptor, 'wb') as data:
+                data.write(content)
+            os.replace(temporary_path, path)
+        except:
+            self.__remove(temporary_path)
+            raise
+
+    def __size(self):
+        if self._size is None:
+            self._size = sum(entry.stat().st_size for entry in self.__bodies())
+
+        return self._size
+
+    def __bodies(self):
+        with os.scandir(self._path) as scan:
+            return [ entry for entry in scan if entry.name.endswith(BODY_SUFFIX) ]
+
+    def __evict(self):
+        """Remove the least recently used bodies until the cache fits into
+        max_bytes."""
+        bodies = sorted(( (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                for entry in self.__bodies() ))
+
+        self._size = sum(size for _, size, _ in bodies)
+        for _, size, path in bodies:
+            if self._size <= self._max_bytes:
+                break
+
+            self.__remove(path)
+            self.__remove(path[:-len(BODY_SUFFIX)] + META_SUFFIX)
+            self._size -= size
+
+    def __remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            logger.debug("Failed to remove %s from the HTTP cache", path)
+
+    def __file(self, key, suffix):
+        return os.path.join(self._path, key + suffix)
+
+
+class CachedResponse:
+    """Response that is served from the HttpCache, provides the content, text
+    and json() of a requests.Response."""
+    status_code = 200
+
+    def __init__(self, url, content, encoding=None):
+        self.url = url
+        self.content = content
+        self.encoding = encoding
+
+    @property
+    def text(self):
+        try:
+            return str(self.content, self.encoding or 'utf-8', errors='replace')
+        except LookupError:
+            return str(self.content, errors='replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        pass
@@ -0,0 +1,103 @@
+import bisect
+import threading
+
+
+LATENCY_BUCKETS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0)
+
+
+class MetricsCollector:
+    """Collects the timings of the stages of the batch pipeline.
+
+    A collector is attached to a GeneratorDataSet with instrument(). Any object
+    with the methods observe_stage, observe_record and set_gauge can be used
+    instead, e.g. to forward the timings to another metrics library:
+
+      - observe_stage(stage, seconds) with the duration of a pipeline stage of
+        a batch, the stages are 'inventory', 'records', 'transform',
+        'finalize' and 'targets'
+      - observe_record(encoder, seconds) with the duration of the transform of
+        a single record by the data encoder at index encoder
+      - set_gauge(name, value) with e.g. the 'prefetch_queue_depth', the number
+        of batches that are ready when the next batch is requested
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self._buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+            self._records = {}
+            self._gauges = {}
+
+    def observe_stage(self, stage, seconds):
+        with self._lock:
+            count, total, maximum = self._stages.get(stage, (0, 0.0, 0.0))
+            self._stages[stage] = (count + 1, total + seconds, max(maximum, seconds))
+
+    def observe_record(self, encoder, seconds):
+        with self._lock:
+            histogram = self._records.get(encoder)
+            if histogram is None:
+                histogram = self._records[encoder] = [0] * (len(self._buckets) + 1) + [0.0]
+
+            histogram[bisect.bisect_left(self._buckets, seconds)] += 1
+            histogram[-1] += seconds
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def summary(self):
+        """Return the collected metrics as dict.
+
+        The stages contain the count, total and mean seconds and the maximum
+        seconds of each stage. The record latencies contain the count, total
+        seconds and the cumulative counts of the latency buckets per encoder.
+        """
+        with self._lock:
+            stages = { stage: { 'count': count, 'seconds': total, 'mean': total / count, 'max': maximum }
+                    for stage, (count, total, maximum) in self._stages.items() }
+            records = { encoder: self.__histogram(histogram)
+                    for encoder, histogram in self._records.items() }
+
+            return { 'stages': stages, 'records': records, 'gauges': dict(self._gauges) }
+
+    def __histogram(self, histogram):
+        counts = histogram[:-1]
+        cumulative = [ sum(counts[:i + 1]) for i in range(len(self._buckets)) ]
+
+        return {
+            'count': sum(counts),
+            'seconds': histogram[-1],
+            'buckets': dict(zip(self._buckets, cumulative)) }
+
+    def to_prometheus(self, prefix='datagenerator'):
+        """Return the collected metrics in the Prometheus text exposition
+        format."""
+        summary = self.summary()
+        lines = [
+            '# HELP {}_stage_seconds Duration of the pipeline stages per batch.'.format(prefix),
+            '# TYPE {}_stage_seconds summary'.format(prefix) ]
+        for stage, stats in sorted(summary['stages'].items()):
+            lines.append('{}_stage_seconds_sum{{stage="{}"}} {!r}'.format(prefix, stage, stats['seconds']))
+            lines.append('{}_stage_seconds_count{{stage="{}"}} {}'.format(prefix, stage, stats['count']))
+
+        lines.extend([
+            '# HELP {}_record_seconds Duration of the transform of single records.'.format(prefix),
+            '# TYPE {}_record_seconds histogram'.format(prefix) ])
+        for encoder, histogram in sorted(summary['records'].items()):
+            for bucket, count in histogram['buckets'].items():
+                lines.append('{}_record_seconds_bucket{{encoder="{}",le="{!r}"}} {}'.format(
+                        prefix, encoder, bucket, count))
+            lines.append('{}_record_seconds_bucket{{encoder="{}",le="+Inf"}} {}'.format(
+                    prefix, encoder, histogram['count']))
+            lines.append('{}_record_seconds_sum{{encoder="{}"}} {!r}'.format(prefix, encoder, histogram['seconds']))
+            lines.append('{}_record_seconds_count{{encoder="{}"}} {}'.format(prefix, encoder, histogram['count']))
+
+        for name, value in sorted(summary['gauges'].items()):
+            lines.append('# TYPE {}_{} gauge'.format(prefix, name))
+            lines.append('{}_{} {!r}'.format(prefix, name, value))
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,77 @@
+class Record:
+    """Lightweight read-only view of an inventory row.
+
+    Supports the access patterns of the pandas.Series that is created for a row
+    by DataFrame.iterrows(), i.e. record['id'], record.id, record.get('id'),
+    record.name for the index label of the row and iteration over the values,
+    at a fraction of the cost.
+    """
+    __slots__ = ('_columns', '_values', 'name')
+
+    def __init__(self, columns, values, name=None):
+        self._columns = columns
+        self._values = values
+        self.name = name
+
+    def __getitem__(self, key):
+        return self._values[self._columns[key]]
+
+    def __getattr__(self, key):
+        if key.startswith('_'):
+            raise AttributeError(key)
+
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
+
+    def __contains__(self, key):
+        return key in self._columns
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getstate__(self):
+        return self._columns, self._values, self.name
+
+    def __setstate__(self, state):
+        self._columns, self._values, self.name = state
+
+    def __repr__(self):
+        return 'Record(' + repr(self.to_dict()) + ', name=' + repr(self.name) + ')'
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self._columns)
+
+    def values(self):
+        return list(self._values)
+
+    def items(self):
+        return zip(self._columns, self._values)
+
+    def to_dict(self):
+        return dict(self.items())
+
+
+def inventory_records(inventory):
+    """Create a Record for each row of the inventory DataFrame.
+
+    The values are extracted column wise and the column lookup is shared by all
+    records.
+    """
+    columns = { column: position for position, column in enumerate(inventory.columns) }
+    if columns:
+        rows = zip(*[ values.tolist() for _, values in inventory.items() ])
+    else:
+        rows = [()] * len(inventory)
+
+    return [ Record(columns, row, name) for row, name in zip(rows, inventory.index.tolist()) ]
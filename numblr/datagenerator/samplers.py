@@ -0,0 +1,168 @@
+import numpy as np
+
+
+class Sampler:
+    """Determines the batches of inventory positions in each epoch.
+
+    columns are the names of the inventory columns that the sampler uses, or
+    None if it may use any column of the inventory.
+    """
+    columns = None
+
+    def epoch_batches(self, inventory, batch_size, truncate, random_state, epoch):
+        """Return the batches of the epoch as slices or arrays of positions in
+        the inventory.
+
+        With truncate=True batches with less than batch_size records are
+        dropped. random_state is an integer that, together with the epoch,
+        determines the random order of the epoch.
+        """
+        raise NotImplementedError()
+
+    def _epoch_random_state(self, random_state, epoch):
+        return np.random.RandomState([random_state, epoch])
+
+
+class SequentialSampler(Sampler):
+    """Batches in inventory order."""
+    columns = ()
+
+    def epoch_batches(self, inventory, batch_size, truncate, random_state, epoch):
+        size = len(inventory)
+
+        return [ slice(i, i + batch_size) for i in range(0, size, batch_size)
+                if i + batch_size <= size or not truncate ]
+
+
+class ShuffleSampler(Sampler):
+    """Batches from a random permutation of the inventory in each epoch."""
+    columns = ()
+
+    def epoch_batches(self, inventory, batch_size, truncate, random_state, epoch):
+        positions = self._epoch_random_state(random_state, epoch).permutation(len(inventory))
+
+        return _split(positions, batch_size, truncate)
+
+
+class BucketSampler(Sampler):
+    """Batches of records with similar size.
+
+    The records are sorted by the size column and the sorted records are
+    divided into buckets of bucket_batches batches. In each epoch the records
+    are shuffled within their bucket before the bucket is divided into batches,
+    and the order of the batches of all buckets is shuffled.
+    """
+    def __init__(self, column='size', bucket_batches=16, shuffle=True):
+        if not isinstance(bucket_batches, int) or bucket_batches < 1:
+            raise ValueError("bucket_batches must be a positive integer: " + str(bucket_batches))
+
+        self._column = column
+        self._bucket_batches = bucket_batches
+        self._shuffle = shuffle
+        self._sizes = None
+        self._order = None
+
+    @property
+    def columns(self):
+        return (self._column,)
+
+    def epoch_batches(self, inventory, batch_size, truncate, random_state, epoch):
+        order = self.__size_order(inventory)
+        random = self._epoch_random_state(random_state, epoch)
+        bucket_size = batch_size * self._bucket_batches
+
+        batches = []
+        for i in range(0, len(order), bucket_size):
+            bucket = order[i:i + bucket_size]
+            if self._shuffle:
+                bucket = random.permutation(bucket)
+
+            batches.extend(_split(bucket, batch_size, truncate))
+
+        if self._shuffle:
+            batches = [ batches[i] for i in random.permutation(len(batches)) ]
+
+        return batches
+
+    def __size_order(self, inventory):
+        sizes = inventory[self._column].to_numpy()
+        if self._sizes is None or not np.array_equal(sizes, self._sizes):
+            self._order = np.argsort(sizes, kind='stable')
+            self._sizes = sizes.copy()
+
+        return self._order
+
+
+class LocalitySampler(Sampler):
+    """Batches in the order in which the records are stored, as given by the
+    locality_order(inventory) of the encoder, e.g. of an ArchiveDataEncoder.
+
+    The order is computed once for an inventory and reused as long as the index
+    of the inventory does not change.
+    """
+    def __init__(self, encoder):
+        if not hasattr(encoder, 'locality_order'):
+            raise ValueError("encoder must provide locality_order: " + str(type(encoder)))
+
+        self._encoder = encoder
+        self._index = None
+        self._order = None
+
+    def epoch_batches(self, inventory, batch_size, truncate, random_state, epoch):
+        return _split(self.__order(inventory), batch_size, truncate)
+
+    def __order(self, inventory):
+        index = inventory.index
+        if self._index is None or not (self._index is index or self._index.equals(index)):
+            self._order = np.asarray(self._encoder.locality_order(inventory))
+            self._index = index
+
+        return self._order
+
+
+class DistributedSampler(Sampler):
+    """Batches of one of num_shards disjoint shards of the batches of another
+    sampler, e.g. for the ranks of data-parallel training.
+
+    The batches of each epoch are dealt round-robin to the shards, after
+    dropping batches with less than batch_size records, which are only
+    sampled with truncate=False, and the last batches that would give some
+    shards one batch more than others. Hence all shards get the same number
+    of records. All shards must draw with the same random_state to get
+    disjoint batches.
+    """
+    def __init__(self, sampler, num_shards, shard_index):
+        if not isinstance(num_shards, int) or num_shards < 1:
+            raise ValueError("num_shards must be a positive integer: " + str(num_shards))
+        if not isinstance(shard_index, int) or not 0 <= shard_index < num_shards:
+            raise ValueError("shard_index must be an integer in [0, num_shards): " + str(shard_index))
+
+        self._sampler = sampler
+        self._num_shards = num_shards
+        self._shard_index = shard_index
+
+    @property
+    def sampler(self):
+        return self._sampler
+
+    @property
+    def columns(self):
+        return getattr(self._sampler, 'columns', None)
+
+    def epoch_batches(self, inventory, batch_size, truncate, random_state, epoch):
+        batches = self._sampler.epoch_batches(inventory, batch_size, truncate, random_state, epoch)
+        if not truncate and self._num_shards > 1:
+            size = len(inventory)
+            batches = [ batch for batch in batches if _length(batch, size) == batch_size ]
+        count = len(batches) - len(batches) % self._num_shards
+
+        return batches[self._shard_index:count:self._num_shards]
+
+
+def _length(batch, size):
+    return len(range(*batch.indices(size))) if isinstance(batch, slice) else len(batch)
+
+
+def _split(positions, batch_size, truncate):
+    return [ positions[i:i + batch_size] for i in range(0, len(positions), batch_size)
+            if i + batch_size <= len(positions) or not truncate ]
@@ -0,0 +1,81 @@
+class BatchSequence:
+    """Random access to the batches of a GeneratorDataSet in the current epoch.
+
+    The batches of each epoch are determined by the sampler from random_state
+    and the epoch, hence the batch at an index is the same in any process and
+    batches can be fetched in parallel in any order. on_epoch_end() advances to
+    the next epoch, e.g. to reshuffle.
+    """
+    def __init__(self, data_set, get_batch, batch_size, truncate, sampler, random_state, epoch=0):
+        self._data_set = data_set
+        self._get_batch = get_batch
+        self._batch_size = batch_size
+        self._truncate = truncate
+        self._sampler = sampler
+        self._random_state = random_state
+        self.set_epoch(epoch)
+
+    @property
+    def epoch(self):
+        return self._epoch
+
+    def set_epoch(self, epoch):
+        """Set the epoch that determines the batches."""
+        self._batches = self._data_set._epoch_batches(self._sampler,
+                self._batch_size, self._truncate, self._random_state, epoch)
+        self._epoch = epoch
+
+    def on_epoch_end(self):
+        self.set_epoch(self._epoch + 1)
+
+    def __len__(self):
+        return len(self._batches)
+
+    def __getitem__(self, index):
+        batches = self._batches
+        if not -len(batches) <= index < len(batches):
+            raise IndexError("batch index out of range: " + str(index))
+
+        return getattr(self._data_set, self._get_batch)(self._data_set._records(batches[index]))
+
+    def __iter__(self):
+        return ( self[index] for index in range(len(self)) )
+
+
+def _keras_sequence_type():
+    try:
+        from keras.utils import Sequence
+    except ImportError:
+        from tensorflow.keras.utils import Sequence
+
+    class KerasBatchSequence(BatchSequence, Sequence):
+        """BatchSequence that is a keras.utils.Sequence, the keyword arguments
+        are passed to the Sequence, e.g. workers for Keras 3."""
+        def __init__(self, data_set, get_batch, batch_size, truncate, sampler, random_state,
+                epoch=0, **kwargs):
+            Sequence.__init__(self, **kwargs)
+            BatchSequence.__init__(self, data_set, get_batch, batch_size, truncate, sampler,
+                    random_state, epoch)
+
+    # Pickle finds the class by its name through the module __getattr__
+    KerasBatchSequence.__module__ = __name__
+    KerasBatchSequence.__qualname__ = 'KerasBatchSequence'
+
+    return KerasBatchSequence
+
+
+_keras_sequence = None
+
+
+def __getattr__(name):
+    """Create KerasBatchSequence on first access, such that Keras is only
+    imported if it is used."""
+    global _keras_sequence
+
+    if name == 'KerasBatchSequence':
+        if _keras_sequence is None:
+            _keras_sequence = _keras_sequence_type()
+
+        return _keras_sequence
+
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
@@ -0,0 +1,151 @@
+import os
+import json
+
+import numpy as np
+
+
+INDEX_FILE = 'index.csv'
+META_FILE = 'shards.json'
+TARGETS = 'targets'
+
+
+def data_name(encoder_index):
+    return 'data_' + str(encoder_index)
+
+
+def shard_path(path, name, shard):
+    return os.path.join(path, '{}_{:05d}.npy'.format(name, shard))
+
+
+class ShardWriter:
+    """Writes batches of encoded records into .npy shards of shard_size
+    records.
+
+    Records are written by their position in the data set, each shard is
+    created as memory-mapped file when the first batch is written to it.
+    """
+    def __init__(self, path, size, shard_size):
+        if shard_size < 1:
+            raise ValueError("shard_size must be at least 1: " + str(shard_size))
+
+        self._path = path
+        self._size = size
+        self._shard_size = shard_size
+        self._shards = {}
+
+    def write(self, name, position, batch):
+        batch = np.asarray(batch)
+
+        while len(batch) > 0:
+            shard, offset = divmod(position, self._shard_size)
+            array = self.__shard(name, shard, batch)
+            if array.shape[1:] != batch.shape[1:]:
+                raise ValueError("encoded records must have the same shape: "
+                        + str(batch.shape[1:]) + " != " + str(array.shape[1:]))
+            if not np.can_cast(batch.dtype, array.dtype, 'safe'):
+                raise ValueError("encoded records can not be cast safely to the dtype of the shard: "
+                        + str(batch.dtype) + " != " + str(array.dtype))
+
+            count = min(len(batch), len(array) - offset)
+            array[offset:offset + count] = batch[:count]
+
+            position += count
+            batch = batch[count:]
+
+    def __shard(self, name, shard, batch):
+        current, array = self._shards.get(name, (None, None))
+        if current == shard:
+            return array
+
+        if array is not None:
+            array.flush()
+
+        length = min(self._shard_size, self._size - shard * self._shard_size)
+        array = np.lib.format.open_memmap(shard_path(self._path, name, shard),
+                mode='w+', dtype=batch.dtype, shape=(length,) + batch.shape[1:])
+        self._shards[name] = (shard, array)
+
+        return array
+
+    def close(self):
+        for _, array in self._shards.values():
+            array.flush()
+
+        self._shards = {}
+
+
+def write_meta(path, shard_size, data, targets):
+    with open(os.path.join(path, META_FILE), 'w') as meta:
+        json.dump({ 'shard_size': shard_size, 'data': data, 'targets': targets }, meta)
+
+
+def read_meta(path):
+    with open(os.path.join(path, META_FILE)) as meta:
+        return json.load(meta)
+
+
+class ShardReader:
+    """Reads records by shard and offset from memory-mapped .npy shards."""
+    def __init__(self, path, name):
+        self._path = path
+        self._name = name
+        self._shards = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_shards'] = {}
+
+        return state
+
+    def read(self, shards, offsets):
+        shards = np.asarray(shards)
+        offsets = np.asarray(offsets)
+        if len(shards) == 0:
+            return self.__shard(0)[:0]
+
+        first = self.__shard(shards[0])
+        if (shards == shards[0]).all() and (np.diff(offsets) == 1).all():
+            return first[offsets[0]:offsets[0] + len(offsets)]
+
+        batch = np.empty((len(shards),) + first.shape[1:], dtype=first.dtype)
+        for shard in np.unique(shards):
+            selected = shards == shard
+            batch[selected] = self.__shard(shard)[offsets[selected]]
+
+        return batch
+
+    def __shard(self, shard):
+        if shard not in self._shards:
+            self._shards[shard] = np.load(shard_path(self._path, self._name, shard), mmap_mode='r')
+
+        return self._shards[shard]
+
+
+class ShardDataEncoder:
+    """Data encoder that reads the materialized data of records from shards."""
+    def __init__(self, path, encoder_index=0, shard='shard', offset='offset'):
+        self._reader = ShardReader(path, data_name(encoder_index))
+        self._shard = shard
+        self._offset = offset
+
+    def fit(self, inventory):
+        pass
+
+    def transform_batch(self, records):
+        return self._reader.read([ record[self._shard] for record in records ],
+                [ record[self._offset] for record in records ])
+
+
+class ShardTargetEncoder:
+    """Target encoder that reads the materialized targets of records from
+    shards."""
+    def __init__(self, path, shard='shard', offset='offset'):
+        self._reader = ShardReader(path, TARGETS)
+        self._shard = shard
+        self._offset = offset
+
+    def fit(self, records):
+        return self
+
+    def transform(self, records):
+        return self._reader.read(records[self._shard].to_numpy(), records[self._offset].to_numpy())
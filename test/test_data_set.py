@@ -1,10 +1,22 @@
+import sys
+import json
+import types
+import pickle
+import importlib.util
+import time
 import unittest
+from unittest import mock
 import numpy as np
 from numpy.testing import assert_array_equal
 
 from pandas import DataFrame
 
+from numblr.datagenerator import sequences
 from numblr.datagenerator.dataset import GeneratorDataSet
+from numblr.datagenerator.encoders import PaddingDataEncoder, OneHotRecordEncoder
+from numblr.datagenerator.samplers import BucketSampler
+from numblr.datagenerator.execution import ProcessPool
+from numblr.datagenerator.records import inventory_records
 
 
 class TestGeneratorDataSet(unittest.TestCase):
@@ -74,6 +86,108 @@ class TestGeneratorDataSet(unittest.TestCase):
         self.assertEqual(validation.size, 2)
         self.assertEqual(test.size, 3)
 
+    def test_split_is_random_and_disjoint(self):
+        splits = [ self.data_set.split(validation=0.2, test=0.3, random_state=1) for _ in range(2) ]
+
+        ids = [ [ list(data_set.inventory['id']) for data_set in split ] for split in splits ]
+        self.assertEqual(ids[0], ids[1])
+        self.assertSequenceEqual(sorted(sum(ids[0], [])), sorted(self.inventory['id']))
+
+    def test_split_shares_inventory(self):
+        training, validation, test = self.data_set.split(validation=0.2, test=0.3, random_state=1)
+        self.inventory['target'] = 'cat_2'
+
+        for data_set in (training, validation, test):
+            self.assertSequenceEqual(list(data_set.targets()), [2] * data_set.size)
+
+        data = next(training.data_batches(batch_size=5, epochs=1))
+        expected = [ self.data_encoder(record) for _, record in training.inventory.iterrows() ]
+        self.assertSequenceEqual([ tuple(encoded) for encoded in data ], expected)
+
+    def test_split_inventory_changes_take_effect(self):
+        training, _, _ = self.data_set.split(validation=0.2, test=0.3, random_state=1)
+
+        training.inventory['target'] = 'cat_1'
+        training.inventory['size'] = np.arange(training.size)[::-1]
+
+        self.assertSequenceEqual(list(training.targets()), [1] * training.size)
+        self.assertSequenceEqual(list(self.inventory['target'][:3]), ['cat_0', 'cat_1', 'cat_2'])
+        batch = next(training.target_batches(batch_size=training.size, epochs=1,
+                sampler=BucketSampler(shuffle=False)))
+        self.assertEqual(len(batch), training.size)
+
+    def test_split_inventory_target_changes_require_encode_targets(self):
+        self.data_set.encode_targets()
+        training, _, _ = self.data_set.split(validation=0.2, test=0.3, random_state=1)
+        targets = list(training.targets())
+
+        training.inventory['target'] = 'cat_1'
+        self.assertSequenceEqual(list(training.targets()), targets)
+
+        training.encode_targets()
+        self.assertSequenceEqual(list(training.targets()), [1] * training.size)
+
+    def test_split_stratify(self):
+        self.setUp(size=30, targets=3)
+
+        splits = self.data_set.split(validation=0.2, test=0.3, stratify='target', random_state=2)
+
+        for data_set, count in zip(splits, (15, 6, 9)):
+            self.assertSequenceEqual(list(data_set.inventory['target'].value_counts().sort_index()),
+                    [count // 3] * 3)
+
+    def test_split_of_split(self):
+        training, _, _ = self.data_set.split(validation=0.5, random_state=3)
+
+        training_training, training_validation, _ = training.split(validation=0.4, random_state=4)
+
+        self.assertEqual(training_training.size, 3)
+        self.assertTrue(set(training_validation.inventory['id']) < set(training.inventory['id']))
+        self.assertSequenceEqual(list(training_validation.targets()),
+                [ int(target[-1]) for target in training_validation.inventory['target'] ])
+
+    def test_folds(self):
+        folds = list(self.data_set.folds(k=3, random_state=1))
+
+        self.assertEqual(len(folds), 3)
+        validation_ids = []
+        for training, validation in folds:
+            self.assertEqual(training.size + validation.size, 10)
+            self.assertTrue(set(training.inventory['id']).isdisjoint(validation.inventory['id']))
+            validation_ids.extend(validation.inventory['id'])
+        self.assertSequenceEqual(sorted(validation_ids), sorted(self.inventory['id']))
+        self.assertSequenceEqual(sorted(validation.size for _, validation in folds), [3, 3, 4])
+
+    def test_folds_stratify(self):
+        self.setUp(size=30, targets=3)
+
+        for training, validation in self.data_set.folds(k=5, stratify='target', random_state=5):
+            self.assertSequenceEqual(list(validation.inventory['target'].value_counts()), [2, 2, 2])
+
+    def test_folds_invalid_k(self):
+        for k in (1, 11, 2.0):
+            with self.assertRaises(ValueError):
+                self.data_set.folds(k=k)
+
+    def test_batches_of_split_with_bucket_sampler(self):
+        self.inventory['size'] = np.arange(10)[::-1]
+        training, _, _ = self.data_set.split(validation=0.5, random_state=1)
+
+        batches = training.target_batches(batch_size=2, epochs=1, truncate=False,
+                sampler=BucketSampler(bucket_batches=1, shuffle=False))
+
+        expected = training.inventory.sort_values('size')['target']
+        self.assertSequenceEqual(list(np.concatenate(list(batches))), [ int(target[-1]) for target in expected ])
+
+    def test_sequence_of_split(self):
+        training, _, _ = self.data_set.split(validation=0.2, test=0.3, random_state=1)
+
+        sequence = training.sequence(batch_size=2, truncate=False)
+
+        self.assertEqual(len(sequence), 3)
+        self.assertSequenceEqual(list(np.concatenate([ targets for _, targets in sequence ])),
+                [ int(target[-1]) for target in training.inventory['target'] ])
+
     def test_data(self):
         data = self.data_set.data()
 
@@ -349,6 +463,543 @@ class TestGeneratorDataSet(unittest.TestCase):
             target_postfix = int(record['target'].split('_')[-1])
             self.assertEqual(id_postfix, target_postfix)
 
+    def test_batches_prefetch(self):
+        expected = [ (data, targets) for data, targets
+                in self.data_set.batches(batch_size=3, epochs=2, truncate=False) ]
+
+        generator = self.data_set.batches(batch_size=3, epochs=2, truncate=False,
+                prefetch=3, workers=4)
+
+        batches = [ batch for batch in generator ]
+        self.assertEqual(len(batches), len(expected))
+        for (data, targets), (expected_data, expected_targets) in zip(batches, expected):
+            assert_array_equal(data, expected_data)
+            assert_array_equal(targets, expected_targets)
+
+    def test_data_batches_prefetch_preserves_order(self):
+        def slow_data_encoder(record):
+            position = int(record['id'].split('_')[-1])
+            time.sleep(0.001 * (position % 3))
+
+            return (position,)
+
+        data_set = GeneratorDataSet(self.inventory, slow_data_encoder, self.target_encoder)
+        generator = data_set.data_batches(batch_size=1, epochs=1, prefetch=4, workers=4)
+
+        self.assertSequenceEqual([ int(batch[0][0]) for batch in generator ], list(range(10)))
+
+    def test_batches_prefetch_raises_worker_exception(self):
+        def failing_data_encoder(record):
+            if record['id'] == 'id_5':
+                raise IOError("failed to load " + record['id'])
+
+            return (0,)
+
+        data_set = GeneratorDataSet(self.inventory, failing_data_encoder, self.target_encoder)
+        generator = data_set.batches(batch_size=2, epochs=1, prefetch=2, workers=2)
+
+        self.assertEqual(len(next(generator)), 2)
+        self.assertEqual(len(next(generator)), 2)
+        with self.assertRaises(IOError):
+            [ batch for batch in generator ]
+
+    def test_batches_prefetch_raises_if_no_workers(self):
+        with self.assertRaises(ValueError):
+            self.data_set.batches(batch_size=2, prefetch=2, workers=0)
+
+    def test_batches_processes(self):
+        data_set = GeneratorDataSet(self.inventory, encode_position, self.target_encoder)
+
+        expected = [ batch for batch in data_set.batches(batch_size=4, epochs=2) ]
+        batches = [ batch for batch in data_set.batches(batch_size=4, epochs=2, processes=2) ]
+
+        self.assertEqual(len(batches), len(expected))
+        for (data, targets), (expected_data, expected_targets) in zip(batches, expected):
+            assert_array_equal(data, expected_data)
+            assert_array_equal(targets, expected_targets)
+
+    def test_data_batches_processes_with_prefetch(self):
+        data_set = GeneratorDataSet(self.inventory,
+                [encode_position, encode_position], self.target_encoder)
+
+        generator = data_set.data_batches(batch_size=3, epochs=1, truncate=False,
+                prefetch=2, workers=2, processes=2)
+
+        batches = [ batch for batch in generator ]
+        self.assertEqual(len(batches), 4)
+        assert_array_equal(batches[0][0], [[0], [1], [2]])
+        assert_array_equal(batches[0][1], [[0], [1], [2]])
+        assert_array_equal(batches[3][0], [[9]])
+
+    def test_data_processes(self):
+        data_set = GeneratorDataSet(self.inventory, encode_position, self.target_encoder)
+
+        assert_array_equal(data_set.data(processes=3), np.arange(10).reshape(10, 1))
+
+    def test_data_processes_returns_array_chunks(self):
+        data_set = GeneratorDataSet(self.inventory, encode_position_array, self.target_encoder)
+
+        with ProcessPool(data_set, 2) as pool:
+            data = pool.encode(0, list(inventory_records(self.inventory)))
+
+        self.assertIsInstance(data, np.ndarray)
+        assert_array_equal(data, np.arange(10).reshape(10, 1))
+        assert_array_equal(data_set.data(processes=2), np.arange(10).reshape(10, 1))
+
+    def test_data_processes_uses_overridden_get_data(self):
+        class NegatingGeneratorDataSet(GeneratorDataSet):
+            def _get_data(self, record, encoder):
+                return tuple(-x for x in encoder(record))
+
+            def __copy__(self):
+                return NegatingGeneratorDataSet(self._inventory, self._data_encoder, self._target_encoder)
+
+        data_set = NegatingGeneratorDataSet(self.inventory, encode_position, self.target_encoder)
+
+        assert_array_equal(data_set.data(processes=2), -np.arange(10).reshape(10, 1))
+
+    def test_data_batches_processes_raises_worker_exception(self):
+        data_set = GeneratorDataSet(self.inventory, encode_position_or_fail, self.target_encoder)
+
+        with self.assertRaises(IOError):
+            [ batch for batch in data_set.data_batches(batch_size=5, epochs=1, processes=2) ]
+
+    def test_batches_shared_memory(self):
+        data_set = GeneratorDataSet(self.inventory, encode_position, self.target_encoder)
+
+        expected = [ data for data, _ in data_set.batches(batch_size=2, epochs=2) ]
+
+        generator = data_set.batches(batch_size=2, epochs=2, processes=2, shared_memory=True)
+
+        addresses = set()
+        for index, (data, targets) in enumerate(generator):
+            assert_array_equal(data, expected[index])
+            self.assertEqual(targets.shape, (2,))
+            if index > 0:
+                self.assertFalse(data.flags['OWNDATA'])
+                addresses.add(data.__array_interface__['data'][0])
+
+        self.assertEqual(len(addresses), 2)
+
+    def test_data_batches_shared_memory_with_prefetch(self):
+        data_set = GeneratorDataSet(self.inventory, encode_position, self.target_encoder)
+
+        generator = data_set.data_batches(batch_size=3, epochs=3, truncate=False,
+                prefetch=2, workers=2, processes=2, shared_memory=True)
+
+        batches = [ np.array(batch) for batch in generator ]
+        self.assertEqual(len(batches), 12)
+        for epoch in range(3):
+            assert_array_equal(np.concatenate(batches[epoch * 4:(epoch + 1) * 4]),
+                    np.arange(10).reshape(10, 1))
+
+    def test_data_batches_shared_memory_after_short_first_batch(self):
+        data_set = GeneratorDataSet(self.inventory, encode_position, self.target_encoder)
+
+        generator = data_set.data_batches(batch_size=4, epochs=1, truncate=False,
+                processes=1, shared_memory=True, sampler=ShortFirstBatchSampler())
+
+        batches = [ (np.array(batch), batch.flags['OWNDATA']) for batch in generator ]
+        self.assertSequenceEqual([ len(batch) for batch, _ in batches ], [2, 4, 4])
+        self.assertSequenceEqual([ owned for _, owned in batches[1:] ], [False, False])
+        assert_array_equal(np.concatenate([ batch for batch, _ in batches ]),
+                np.arange(10).reshape(10, 1))
+
+    def test_data_batches_shared_memory_raises_on_shape_mismatch(self):
+        def encode_variable_length(record):
+            return (0,) * (1 + int(record['id'].split('_')[-1]) // 4)
+
+        data_set = GeneratorDataSet(self.inventory, encode_variable_length, self.target_encoder)
+        generator = data_set.data_batches(batch_size=4, epochs=1, processes=1, shared_memory=True)
+
+        self.assertEqual(next(generator).shape, (4, 1))
+        with self.assertRaises(ValueError):
+            next(generator)
+
+    def test_data_batches_shared_memory_requires_processes(self):
+        with self.assertRaises(ValueError):
+            self.data_set.data_batches(batch_size=2, shared_memory=True)
+
+    def test_data_batches_array_encoder_does_not_narrow(self):
+        def widening_encoder(record):
+            position = int(record['id'].split('_')[-1])
+
+            return np.array([position], dtype=np.int32) if position == 0 else np.array([2**40 + position])
+
+        data_set = GeneratorDataSet(self.inventory, widening_encoder, self.target_encoder)
+
+        batch = next(data_set.data_batches(batch_size=4, epochs=1))
+        self.assertEqual(batch.dtype, np.int64)
+        assert_array_equal(batch, [[0], [2**40 + 1], [2**40 + 2], [2**40 + 3]])
+
+        float_encoder = lambda record: np.zeros(1, dtype=np.float32 if record['id'] == 'id_0' else np.float64)
+        data_set = GeneratorDataSet(self.inventory, float_encoder, self.target_encoder)
+        self.assertEqual(next(data_set.data_batches(batch_size=4, epochs=1)).dtype, np.float64)
+
+    def test_data_batches_shared_memory_does_not_narrow(self):
+        def widening_encoder(record):
+            position = int(record['id'].split('_')[-1])
+
+            return np.array([position], dtype=np.int32) if position < 4 else np.array([2**40 + position])
+
+        data_set = GeneratorDataSet(self.inventory, widening_encoder, self.target_encoder)
+        generator = data_set.data_batches(batch_size=4, epochs=1, processes=2, shared_memory=True)
+
+        batches = [ np.array(batch) for batch in generator ]
+        self.assertEqual(batches[0].dtype, np.int32)
+        self.assertEqual(batches[1].dtype, np.int64)
+        assert_array_equal(batches[1], [[2**40 + 4], [2**40 + 5], [2**40 + 6], [2**40 + 7]])
+
+    def test_data_batches_shared_memory_with_output_spec(self):
+        data_set = GeneratorDataSet(self.inventory, SpecPositionDataEncoder(), self.target_encoder)
+        generator = data_set.data_batches(batch_size=4, epochs=1, processes=2, shared_memory=True)
+
+        batches = [ (np.array(batch), batch.flags['OWNDATA']) for batch in generator ]
+        self.assertEqual([ batch.dtype for batch, _ in batches ], [np.float32, np.float32])
+        self.assertFalse(batches[1][1])
+        assert_array_equal(batches[1][0], [[4], [5], [6], [7]])
+
+    def test_data_batches_array_encoder(self):
+        def array_encoder(record):
+            return np.full((2, 2), int(record['id'].split('_')[-1]), dtype=np.float32)
+
+        data_set = GeneratorDataSet(self.inventory, array_encoder, self.target_encoder)
+
+        batches = [ batch for batch in data_set.data_batches(batch_size=4, epochs=1) ]
+        self.assertEqual(len(batches), 2)
+        self.assertEqual(batches[1].shape, (4, 2, 2))
+        self.assertEqual(batches[1].dtype, np.float32)
+        assert_array_equal(batches[1][:, 0, 0], [4, 5, 6, 7])
+
+        data = data_set.data()
+        self.assertEqual(data.shape, (10, 2, 2))
+        assert_array_equal(data[:, 1, 1], np.arange(10))
+
+    def test_data_batches_array_encoder_with_changing_dtype(self):
+        def array_encoder(record):
+            position = int(record['id'].split('_')[-1])
+
+            return np.array([position]) if position < 2 else np.array([position + 0.5])
+
+        data_set = GeneratorDataSet(self.inventory, array_encoder, self.target_encoder)
+
+        batch = next(data_set.data_batches(batch_size=4, epochs=1))
+        assert_array_equal(batch, [[0], [1], [2.5], [3.5]])
+
+    def test_data_batches_encoder_with_output_spec(self):
+        data_encoder = self.data_encoder
+
+        class SpecifiedDataEncoder:
+            output_spec = ((3,), np.float32)
+
+            def transform(self, record):
+                return data_encoder(record)
+
+        data_set = GeneratorDataSet(self.inventory, SpecifiedDataEncoder(), self.target_encoder)
+
+        batch = next(data_set.data_batches(batch_size=4, epochs=1))
+        self.assertEqual(batch.dtype, np.float32)
+        assert_array_equal(batch, [[1, 0, 0], [0, 1, 0], [0, 0, 1], [1, 0, 0]])
+
+    def test_data_batches_raises_if_output_spec_does_not_match(self):
+        class SpecifiedDataEncoder:
+            output_spec = ((2,), np.float32)
+
+            def transform(self, record):
+                return (0, 0, 0)
+
+        data_set = GeneratorDataSet(self.inventory, SpecifiedDataEncoder(), self.target_encoder)
+
+        with self.assertRaises(ValueError):
+            next(data_set.data_batches(batch_size=4, epochs=1))
+
+    def test_batches_shuffle_each_epoch(self):
+        self.setUp(size=25, targets=25)
+        before = list(self.data_set.inventory['id'])
+
+        generator = self.data_set.batches(batch_size=5, epochs=3,
+                shuffle_each_epoch=True, random_state=42)
+
+        epochs = [ [], [], [] ]
+        for index, (data, targets) in enumerate(generator):
+            assert_array_equal(np.argmax(data, axis=1), targets)
+            epochs[index // 5].extend(targets)
+
+        for positions in epochs:
+            self.assertSequenceEqual(sorted(positions), list(range(25)))
+        self.assertNotEqual(epochs[0], list(range(25)))
+        self.assertNotEqual(epochs[0], epochs[1])
+        self.assertNotEqual(epochs[1], epochs[2])
+
+        self.assertSequenceEqual(list(self.data_set.inventory['id']), before)
+
+    def test_batches_shuffle_each_epoch_is_reproducible(self):
+        def targets(random_state):
+            generator = self.data_set.target_batches(batch_size=2, epochs=2, truncate=False,
+                    shuffle_each_epoch=True, random_state=random_state)
+
+            return [ list(batch) for batch in generator ]
+
+        self.assertEqual(targets(7), targets(7))
+        self.assertNotEqual(targets(7), targets(8))
+
+    def test_data_batches_shuffle_each_epoch_truncate(self):
+        generator = self.data_set.data_batches(batch_size=3, epochs=2, shuffle_each_epoch=True)
+
+        batches = [ batch for batch in generator ]
+        self.assertEqual(len(batches), 6)
+        self.assertEqual({ batch.shape for batch in batches }, { (3, 3) })
+
+    def test_batches_bucket_sampler(self):
+        inventory = DataFrame.from_records([ { 'id': 'id_{}'.format(i), 'size': (i * 3) % 10 }
+                for i in range(10) ])
+
+        def data_encoder(record):
+            return [1] * (record['size'] + 1)
+
+        def target_encoder(records):
+            return list(records['size'])
+
+        data_set = GeneratorDataSet(inventory, PaddingDataEncoder(data_encoder), target_encoder)
+        generator = data_set.batches(batch_size=2, epochs=1,
+                sampler=BucketSampler(bucket_batches=1), random_state=5)
+
+        batches = [ batch for batch in generator ]
+        self.assertEqual(len(batches), 5)
+        self.assertEqual(sorted(np.concatenate([ targets for _, targets in batches ])), list(range(10)))
+        for data, targets in batches:
+            self.assertEqual(sorted(targets)[1] - sorted(targets)[0], 1)
+            self.assertEqual(data.shape, (2, max(targets) + 1))
+            assert_array_equal(data.sum(axis=1), np.array(targets) + 1)
+
+    def test_batches_sharded(self):
+        self.setUp(size=25, targets=25)
+
+        shards = [ [ targets for _, targets in self.data_set.batches(batch_size=2, epochs=2,
+                shuffle_each_epoch=True, random_state=3, num_shards=4, shard_index=index) ]
+                for index in range(4) ]
+
+        self.assertEqual([ len(batches) for batches in shards ], [6] * 4)
+        for epoch in range(2):
+            targets = np.concatenate([ target for batches in shards
+                    for target in batches[epoch * 3:epoch * 3 + 3] ])
+            self.assertEqual(len(set(targets)), 24)
+
+    def test_batches_sharded_requires_random_state_to_shuffle(self):
+        with self.assertRaises(ValueError):
+            self.data_set.batches(batch_size=2, shuffle_each_epoch=True, num_shards=2, shard_index=1)
+
+        generator = self.data_set.target_batches(batch_size=2, epochs=1, num_shards=2, shard_index=1)
+        assert_array_equal(np.concatenate(list(generator)), [2, 0, 0, 1])
+
+    def test_batches_raises_if_no_batches_in_epoch(self):
+        with self.assertRaises(ValueError):
+            next(self.data_set.batches(batch_size=5, num_shards=3, shard_index=2))
+
+    def test_batches_resume_from_state(self):
+        self.setUp(size=12, targets=12)
+        expected = [ targets for _, targets in self.data_set.batches(batch_size=4, epochs=3,
+                shuffle_each_epoch=True, random_state=7) ]
+
+        iterator = self.data_set.batches(batch_size=4, epochs=3, shuffle_each_epoch=True,
+                random_state=7, prefetch=2)
+        consumed = [ next(iterator)[1] for _ in range(4) ]
+        state = json.loads(json.dumps(iterator.state_dict()))
+        iterator.close()
+        self.assertEqual((state['epoch'], state['batch']), (1, 1))
+
+        resumed = self.data_set.batches(batch_size=4, epochs=3, shuffle_each_epoch=True)
+        resumed.load_state_dict(state)
+
+        batches = consumed + [ targets for _, targets in resumed ]
+        self.assertEqual(len(batches), 9)
+        for batch, expected_batch in zip(batches, expected):
+            assert_array_equal(batch, expected_batch)
+
+    def test_data_batches_resume_skips_returned_batches(self):
+        encoded = []
+        def data_encoder(record):
+            encoded.append(record['id'])
+            return encode_position(record)
+
+        data_set = GeneratorDataSet(self.inventory, data_encoder, self.target_encoder)
+        iterator = data_set.data_batches(batch_size=2, epochs=1)
+        next(iterator)
+        next(iterator)
+        state = iterator.state_dict()
+
+        del encoded[:]
+        resumed = data_set.data_batches(batch_size=2, epochs=1)
+        resumed.load_state_dict(state)
+
+        self.assertEqual([ list(batch[:, 0]) for batch in resumed ], [[4, 5], [6, 7], [8, 9]])
+        self.assertEqual(encoded, [ 'id_' + str(i) for i in range(4, 10) ])
+
+    def test_batches_load_state_raises_on_batch_size_mismatch(self):
+        state = self.data_set.batches(batch_size=2).state_dict()
+
+        with self.assertRaises(ValueError):
+            self.data_set.batches(batch_size=3).load_state_dict(state)
+
+    def test_batches_instrumented(self):
+        collector = self.data_set.instrument()
+
+        batches = list(self.data_set.batches(batch_size=2, epochs=1, prefetch=2))
+
+        summary = collector.summary()
+        self.assertEqual(set(summary['stages'].keys()),
+                { 'inventory', 'records', 'transform', 'finalize', 'targets' })
+        for stage in summary['stages'].values():
+            self.assertEqual(stage['count'], len(batches))
+        self.assertEqual(summary['records'][0]['count'], self.data_set.size)
+        self.assertIn('prefetch_queue_depth', summary['gauges'])
+
+        self.data_set.disable_instrumentation()
+        list(self.data_set.batches(batch_size=2, epochs=1))
+        self.assertEqual(collector.summary()['records'][0]['count'], self.data_set.size)
+
+    def test_sequence(self):
+        sequence = self.data_set.sequence(batch_size=3)
+
+        self.assertEqual(len(sequence), 3)
+        expected = list(self.data_set.batches(batch_size=3, epochs=1))
+        for index in [2, 0, 1, -1]:
+            assert_array_equal(sequence[index][0], expected[index][0])
+            assert_array_equal(sequence[index][1], expected[index][1])
+
+        with self.assertRaises(IndexError):
+            sequence[3]
+
+    def test_sequence_shuffles_on_epoch_end(self):
+        self.setUp(size=12, targets=12)
+        sequence = self.data_set.sequence(batch_size=4, shuffle_each_epoch=True, random_state=2)
+        expected = list(self.data_set.target_batches(batch_size=4, epochs=2,
+                shuffle_each_epoch=True, random_state=2))
+
+        first = [ targets for _, targets in sequence ]
+        sequence.on_epoch_end()
+        second = [ sequence[index][1] for index in range(len(sequence)) ]
+
+        self.assertEqual(sequence.epoch, 1)
+        for batch, expected_batch in zip(first + second, expected):
+            assert_array_equal(batch, expected_batch)
+
+    def test_sequence_is_picklable(self):
+        data_set = GeneratorDataSet(self.inventory, encode_position, CountingTargetEncoder())
+        sequence = data_set.sequence(batch_size=3, shuffle_each_epoch=True, random_state=2)
+
+        restored = pickle.loads(pickle.dumps(sequence))
+
+        assert_array_equal(restored[1][1], sequence[1][1])
+
+    @unittest.skipUnless(importlib.util.find_spec('keras'), "requires keras")
+    def test_keras_sequence(self):
+        from keras.utils import Sequence
+
+        sequence = self.data_set.keras_sequence(batch_size=3)
+
+        self.assertIsInstance(sequence, Sequence)
+        self.assertEqual(len(sequence), 3)
+        assert_array_equal(sequence[0][1], [0, 1, 2])
+
+    def test_keras_sequence_is_picklable(self):
+        keras = types.ModuleType('keras')
+        keras.utils = types.ModuleType('keras.utils')
+        keras.utils.Sequence = StubKerasSequence
+        data_set = GeneratorDataSet(self.inventory, encode_position, CountingTargetEncoder())
+
+        with mock.patch.dict(sys.modules, { 'keras': keras, 'keras.utils': keras.utils }), \
+                mock.patch.object(sequences, '_keras_sequence', None):
+            sequence = data_set.keras_sequence(batch_size=3)
+            restored = pickle.loads(pickle.dumps(sequence))
+
+            self.assertIs(type(restored), type(sequence))
+            assert_array_equal(restored[1][1], sequence[1][1])
+
+    def test_data_locality(self):
+        data_set = GeneratorDataSet(self.inventory, ReversedOrderEncoder(), self.target_encoder)
+
+        assert_array_equal(data_set.data(locality=True), data_set.data())
+        self.assertEqual(data_set.data_encoder.encoded, [ 'id_' + str(i) for i in range(9, -1, -1) ]
+                + [ 'id_' + str(i) for i in range(10) ])
+
+    def test_data_locality_requires_locality_order(self):
+        with self.assertRaises(ValueError):
+            self.data_set.data(locality=True)
+
+    def test_batches_readahead(self):
+        encoder = ReversedOrderEncoder()
+        encoder.readahead = True
+        data_set = GeneratorDataSet(self.inventory, encoder, self.target_encoder)
+
+        list(data_set.data_batches(batch_size=3, epochs=1, truncate=False))
+
+        self.assertEqual(encoder.advised, [ ['id_3', 'id_4', 'id_5'], ['id_6', 'id_7', 'id_8'], ['id_9'] ])
+
+    def test_batches_raises_if_sampler_and_shuffle_each_epoch(self):
+        with self.assertRaises(ValueError):
+            self.data_set.batches(batch_size=2, shuffle_each_epoch=True, sampler=BucketSampler())
+
+    def test_target_batches_encoded_targets(self):
+        target_encoder = CountingTargetEncoder()
+        data_set = GeneratorDataSet(self.inventory, PositionDataEncoder(), target_encoder)
+        data_set.fit_encoders()
+        self.assertEqual(target_encoder.transformed, 1)
+
+        for _, (data, targets) in zip(range(6), data_set.batches(batch_size=3,
+                shuffle_each_epoch=True, random_state=1)):
+            assert_array_equal(targets, data[:, 0] % 3)
+
+        self.assertEqual(target_encoder.transformed, 1)
+
+    def test_encoded_targets_after_shuffle_sort_and_split(self):
+        target_encoder = CountingTargetEncoder()
+        data_set = GeneratorDataSet(self.inventory.copy(), PositionDataEncoder(), target_encoder)
+        data_set.fit_encoders()
+
+        data_set.shuffle(random_state=3)
+        training, validation, test = data_set.split(validation=0.2, test=0.3)
+        training.sort(columns='id', ascending=False)
+
+        for encoded in [ data_set, training, validation, test ]:
+            expected = [ encode_target(record) for _, record in encoded.inventory.iterrows() ]
+            self.assertSequenceEqual(list(encoded.targets()), expected)
+
+        self.assertEqual(target_encoder.transformed, 1)
+
+    def test_encoded_targets_transforms_added_records(self):
+        target_encoder = CountingTargetEncoder()
+        data_set = GeneratorDataSet(self.inventory.copy(), PositionDataEncoder(), target_encoder)
+        data_set.fit_encoders()
+
+        data_set.inventory.loc[10] = { 'id': 'id_10', 'target': 'cat_4' }
+
+        self.assertSequenceEqual(list(data_set.targets()), [0, 1, 2, 0, 1, 2, 0, 1, 2, 0, 4])
+        self.assertEqual(target_encoder.transformed, 2)
+
+    def test_target_batches_sparse_encoded_targets(self):
+        target_encoder = OneHotRecordEncoder(sparse=True, dtype=np.uint8)
+        data_set = GeneratorDataSet(self.inventory, PositionDataEncoder(), target_encoder)
+        data_set.fit_encoders()
+
+        for data, targets in data_set.batches(batch_size=4, epochs=1,
+                shuffle_each_epoch=True, random_state=1):
+            self.assertEqual(targets.format, 'csr')
+            assert_array_equal(targets.toarray(), np.eye(3, dtype=np.uint8)[data[:, 0] % 3])
+
+        self.assertEqual(data_set.targets().shape, (10, 3))
+
+    def test_encoded_targets_are_compact(self):
+        target_encoder = OneHotRecordEncoder(dtype=np.float32)
+        data_set = GeneratorDataSet(self.inventory, PositionDataEncoder(), target_encoder)
+        data_set.fit_encoders()
+
+        self.assertEqual(data_set._encoded_targets[1].shape, (10,))
+        training, _, _ = data_set.split(validation=0.5, random_state=1)
+        for data, targets in training.batches(batch_size=2, epochs=1):
+            self.assertEqual(targets.dtype, np.float32)
+            assert_array_equal(targets, np.eye(3)[data[:, 0] % 3])
+
     def test_batches_raises_if_batch_size_too_large(self):
         with self.assertRaises(ValueError):
             self.data_set.batches(batch_size=100)
@@ -361,6 +1012,79 @@ class TestGeneratorDataSet(unittest.TestCase):
 
 
 
+def encode_position(record):
+    return (int(record['id'].split('_')[-1]),)
+
+
+def encode_position_array(record):
+    return np.array(encode_position(record), dtype=np.int64)
+
+
+def encode_position_or_fail(record):
+    if record['id'] == 'id_7':
+        raise IOError("failed to load " + record['id'])
+
+    return encode_position(record)
+
+
+def encode_target(record):
+    return int(record['target'].split('_')[-1])
+
+
+class CountingTargetEncoder:
+    def __init__(self):
+        self.transformed = 0
+
+    def fit(self, records):
+        return self
+
+    def transform(self, records):
+        self.transformed += 1
+
+        return [ encode_target(record) for _, record in records.iterrows() ]
+
+
+class PositionDataEncoder:
+    def fit(self, inventory):
+        pass
+
+    def transform(self, record):
+        return encode_position(record)
+
+
+class SpecPositionDataEncoder(PositionDataEncoder):
+    output_spec = ((1,), np.float32)
+
+
+class StubKerasSequence:
+    def __init__(self, **kwargs):
+        pass
+
+
+class ShortFirstBatchSampler:
+    def epoch_batches(self, inventory, batch_size, truncate, random_state, epoch):
+        return [ slice(0, 2) ] + [ slice(i, i + batch_size) for i in range(2, len(inventory), batch_size) ]
+
+
+class ReversedOrderEncoder:
+    readahead = False
+
+    def __init__(self):
+        self.encoded = []
+        self.advised = []
+
+    def transform(self, record):
+        self.encoded.append(record['id'])
+
+        return encode_position(record)
+
+    def locality_order(self, inventory):
+        return np.arange(len(inventory))[::-1]
+
+    def advise_batch(self, inventory):
+        self.advised.append(list(inventory['id']))
+
+
 class TestBatchDataEncoder:
     def __init__(self, id):
         self.id = id
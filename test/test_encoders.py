@@ -1,11 +1,23 @@
 from pprint import pprint
 
+import os
+import time
+import pickle
+import hashlib
+import tarfile
+import tempfile
+import zipfile
+import threading
 import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 import pandas as pd
 import numpy as np
 from numpy.testing import assert_array_equal
 
 from numblr.datagenerator.encoders import *
+from numblr.datagenerator.httpcache import HttpCache
 
 class TestFileDataEncoder(unittest.TestCase):
     def setUp(self):
@@ -41,6 +53,191 @@ class TestFileDataEncoder(unittest.TestCase):
         self.assertEqual(self.encoder.get_size(self.records.iloc[1]), 7)
         self.assertEqual(self.encoder.get_size(self.records.iloc[2]), 7)
 
+    def test_get_metadata(self):
+        metadata = self.encoder.get_metadata(self.records)
+
+        self.assertSequenceEqual(metadata['path'],
+                ['test/resources/id1.txt', 'test/resources/id2.txt', 'test/resources/id3.txt'])
+        self.assertSequenceEqual(metadata['size'], [7, 7, 7])
+
+    def test_get_metadata_of_missing_file(self):
+        records = pd.DataFrame.from_records([ { 'id': 'id1' }, { 'id': 'missing' } ])
+
+        metadata = self.encoder.get_metadata(records, keys=('size',))
+
+        self.assertEqual(set(metadata.keys()), { 'size' })
+        self.assertEqual(metadata['size'][0], 7)
+        self.assertTrue(np.isnan(metadata['size'][1]))
+
+    def test_output_spec(self):
+        self.assertIsNone(self.encoder.output_spec)
+        self.assertFalse(self.encoder.finalizes_batch)
+
+        self.data_encoder.output_spec = ((), np.int64)
+        self.assertEqual(self.encoder.output_spec, ((), np.int64))
+
+    def test_locality_order(self):
+        records = pd.DataFrame.from_records([ { 'id': 'id' + str(i) } for i in range(1, 11) ])
+        inodes = [ os.stat('test/resources/id{}.txt'.format(i)).st_ino for i in range(1, 11) ]
+
+        order = self.encoder.locality_order(records)
+
+        self.assertSequenceEqual(list(order), list(np.argsort(inodes, kind='stable')))
+
+    def test_advise_batch(self):
+        with mock.patch('os.posix_fadvise') as fadvise:
+            self.encoder.advise_batch(self.records)
+            fadvise.assert_not_called()
+
+            encoder = FileDataEncoder(self.data_encoder, 'test/resources', lambda id: id + '.txt',
+                    readahead=True)
+            self.assertTrue(encoder.readahead)
+            encoder.advise_batch(self.records)
+            self.assertEqual(fadvise.call_count, 3)
+            self.assertEqual(fadvise.call_args[0][1:], (0, 0, os.POSIX_FADV_WILLNEED))
+
+
+class TestFileDataEncoderMmap(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.array = np.arange(12, dtype=np.float32).reshape(3, 4)
+        self.array.tofile(os.path.join(self.directory.name, 'raw.bin'))
+        np.save(os.path.join(self.directory.name, 'array.npy'), self.array)
+        open(os.path.join(self.directory.name, 'empty.bin'), 'wb').close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def encoder(self, **kwargs):
+        return FileDataEncoder(lambda data: data, self.directory.name, lambda id: id, mmap=True, **kwargs)
+
+    def test_transform_memoryview(self):
+        view = self.encoder().transform({ 'id': 'raw.bin' })
+
+        self.assertIsInstance(view, memoryview)
+        self.assertTrue(view.readonly)
+        array = np.frombuffer(view, dtype=np.float32).reshape(3, 4)
+        assert_array_equal(array, self.array)
+
+        del view
+        assert_array_equal(array, self.array)
+
+    def test_transform_empty_file(self):
+        self.assertEqual(len(self.encoder().transform({ 'id': 'empty.bin' })), 0)
+
+    def test_transform_npy(self):
+        array = self.encoder().transform({ 'id': 'array.npy' })
+
+        self.assertIsInstance(array, np.memmap)
+        assert_array_equal(array, self.array)
+
+    def test_transform_with_dtype_and_shape(self):
+        array = self.encoder(dtype=np.float32, shape=(3, 4)).transform({ 'id': 'raw.bin' })
+
+        self.assertIsInstance(array, np.memmap)
+        self.assertFalse(array.flags.writeable)
+        assert_array_equal(array, self.array)
+
+        flat = self.encoder(dtype=np.float32).transform({ 'id': 'raw.bin' })
+        assert_array_equal(flat, self.array.flatten())
+
+    def test_raises_on_dtype_without_mmap(self):
+        with self.assertRaises(ValueError):
+            FileDataEncoder(lambda data: data, self.directory.name, lambda id: id, dtype=np.float32)
+
+        with self.assertRaises(ValueError):
+            FileDataEncoder(lambda data: data, self.directory.name, lambda id: id, mmap=True, shape=(3, 4))
+
+
+class TestArchiveDataEncoder(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.tar_path = os.path.join(self.directory.name, 'shard_0.tar')
+        self.zip_path = os.path.join(self.directory.name, 'shard_1.zip')
+
+        with tarfile.open(self.tar_path, 'w') as archive:
+            for i in [3, 1, 2]:
+                archive.add('test/resources/id{}.txt'.format(i), arcname='id{}.txt'.format(i))
+        with zipfile.ZipFile(self.zip_path, 'w') as archive:
+            for i in [5, 4]:
+                archive.write('test/resources/id{}.txt'.format(i), arcname='data/id{}.txt'.format(i))
+
+        self.records = pd.DataFrame.from_records([ { 'id': 'id' + str(i) } for i in range(1, 6) ])
+
+        self.data_encoder = decode_number
+        self.encoder = ArchiveDataEncoder(decode_number, [self.tar_path, self.zip_path], map_member)
+
+    def tearDown(self):
+        self.encoder.close()
+        self.directory.cleanup()
+
+    def test_transform(self):
+        file_encoder = FileDataEncoder(self.data_encoder, 'test/resources', lambda id: id + '.txt')
+
+        for _, record in self.records.iterrows():
+            self.assertEqual(self.encoder.transform(record), file_encoder.transform(record))
+
+    def test_transform_binary(self):
+        encoder = ArchiveDataEncoder(lambda data: data.read(), self.tar_path,
+                lambda id: id + '.txt', binary=True)
+
+        with open('test/resources/id2.txt', 'rb') as data:
+            self.assertEqual(encoder.transform({ 'id': 'id2' }), data.read())
+
+        encoder.close()
+
+    def test_get_metadata(self):
+        metadata = self.encoder.get_metadata(self.records, keys=('path', 'size', 'archive', 'offset'))
+
+        self.assertEqual(metadata['path'][0], os.path.join(self.tar_path, 'id1.txt'))
+        self.assertEqual(metadata['path'][4], os.path.join(self.zip_path, 'data/id5.txt'))
+        self.assertSequenceEqual(metadata['size'], [7, 7, 7, 7, 7])
+        self.assertSequenceEqual(metadata['archive'], [0, 0, 0, 1, 1])
+        self.assertEqual(len(set(metadata['offset'])), 5)
+
+    def test_get_sizes_of_missing_member(self):
+        records = pd.DataFrame.from_records([ { 'id': 'id1' }, { 'id': 'missing' } ])
+
+        sizes = self.encoder.get_metadata(records, keys=('size',))['size']
+
+        self.assertEqual(sizes[0], 7)
+        self.assertTrue(np.isnan(sizes[1]))
+
+    def test_locality_order(self):
+        self.assertSequenceEqual(list(self.encoder.locality_order(self.records)), [2, 0, 1, 4, 3])
+
+    def test_pickle(self):
+        self.encoder.fit(self.records)
+        self.encoder.transform({ 'id': 'id1' })
+
+        encoder = pickle.loads(pickle.dumps(self.encoder))
+
+        self.assertEqual(encoder.transform({ 'id': 'id4' }), 4)
+        encoder.close()
+
+    def test_raises_on_compressed_archive(self):
+        path = os.path.join(self.directory.name, 'compressed.zip')
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.write('test/resources/id1.txt', arcname='id1.txt')
+
+        with self.assertRaises(ValueError):
+            ArchiveDataEncoder(self.data_encoder, path).index
+
+        path = os.path.join(self.directory.name, 'compressed.tar.gz')
+        with tarfile.open(path, 'w:gz') as archive:
+            archive.add('test/resources/id1.txt', arcname='id1.txt')
+
+        with self.assertRaises(ValueError):
+            ArchiveDataEncoder(self.data_encoder, path).index
+
+
+def decode_number(data):
+    return int(data.readline().split('_')[-1])
+
+
+def map_member(id):
+    return ('data/' if id in ('id4', 'id5') else '') + id + '.txt'
+
 
 class TestUrlDataEncoder(unittest.TestCase):
     def setUp(self):
@@ -70,6 +267,457 @@ class TestUrlDataEncoder(unittest.TestCase):
         self.assertTrue(self.encoder(self.records.iloc[0]).lower().startswith("<!doctype html>"))
 
 
+class LocalHttpServer:
+    """HTTP server for the resources 'id<n>' with the content 'data_<n>'.
+
+    Resources under '/slow/' are delayed, resources under '/flaky/' fail with
+    status 503 for the first request. Responses have an ETag and are not
+    modified until the version changes.
+    """
+    def __init__(self, delay=0.2):
+        self.requests = []
+        self.connections = set()
+        self.not_modified = []
+        self.version = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_HEAD(self):
+                self.do_GET(body=False)
+
+            def do_GET(self, body=True):
+                server.requests.append(self.path)
+                server.connections.add(self.client_address)
+
+                if self.path.startswith('/slow/'):
+                    time.sleep(delay)
+                if self.path.startswith('/flaky/') and server.requests.count(self.path) < 2:
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                content = ('data_' + self.path.split('/')[-1][2:]
+                        + ('_v' + str(server.version) if server.version else '')).encode('ascii')
+                etag = '"{}"'.format(server.version)
+                if self.headers.get('If-None-Match') == etag:
+                    server.not_modified.append(self.path)
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(content)))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                if body:
+                    self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+        self.url = 'http://127.0.0.1:{}/'.format(self._server.server_address[1])
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class TestUrlDataEncoderWithLocalServer(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalHttpServer()
+        self.records = pd.DataFrame.from_records([ { 'id': 'id' + str(i) } for i in range(8) ])
+
+    def tearDown(self):
+        self.server.close()
+
+    def records_list(self):
+        return [ record for _, record in self.records.iterrows() ]
+
+    def test_transform(self):
+        encoder = UrlDataEncoder(lambda data: data, self.server.url)
+
+        self.assertEqual(encoder.transform(self.records.iloc[3]), 'data_3')
+
+        encoder.close()
+
+    def test_get_size(self):
+        encoder = UrlDataEncoder(lambda data: data, self.server.url)
+
+        self.assertEqual(encoder.get_size(self.records.iloc[3]), 6)
+
+        encoder.close()
+
+    def test_get_metadata(self):
+        encoder = UrlDataEncoder(lambda data: data, self.server.url, concurrency=4)
+
+        metadata = encoder.get_metadata(self.records)
+
+        self.assertSequenceEqual(metadata['path'], [ self.server.url + 'id' + str(i) for i in range(8) ])
+        self.assertSequenceEqual(metadata['size'], [6] * 8)
+        self.assertEqual(len(self.server.requests), 8)
+
+        encoder.close()
+
+    def test_transform_reuses_connection(self):
+        encoder = UrlDataEncoder(lambda data: data, self.server.url, concurrency=1)
+
+        for record in self.records_list():
+            encoder.transform(record)
+
+        self.assertEqual(len(self.server.requests), 8)
+        self.assertEqual(len(self.server.connections), 1)
+
+        encoder.close()
+
+    def test_session_is_created_once(self):
+        encoder = UrlDataEncoder(lambda data: data, self.server.url, concurrency=8)
+        created = []
+        create_session = encoder._create_session
+
+        def slow_create_session():
+            time.sleep(0.05)
+            created.append(create_session())
+
+            return created[-1]
+
+        encoder._create_session = slow_create_session
+        encoder.transform_batch(self.records_list())
+
+        self.assertEqual(len(created), 1)
+        self.assertIs(encoder.session, created[0])
+
+        encoder.close()
+
+    def test_transform_batch(self):
+        encoder = UrlDataEncoder(lambda data: data, self.server.url, concurrency=4)
+
+        self.assertSequenceEqual(encoder.transform_batch(self.records_list()),
+                [ 'data_' + str(i) for i in range(8) ])
+
+        encoder.close()
+
+    def test_transform_batch_is_concurrent(self):
+        encoder = UrlDataEncoder(lambda data: data, self.server.url + 'slow/', concurrency=8)
+
+        start = time.time()
+        data = encoder.transform_batch(self.records_list())
+        elapsed = time.time() - start
+
+        self.assertSequenceEqual(data, [ 'data_' + str(i) for i in range(8) ])
+        self.assertLess(elapsed, 4 * 0.2)
+
+        encoder.close()
+
+    def test_transform_retries(self):
+        encoder = UrlDataEncoder(lambda data: data, self.server.url + 'flaky/',
+                retries=2, backoff=0.0)
+
+        self.assertSequenceEqual(encoder.transform_batch(self.records_list()[:2]), ['data_0', 'data_1'])
+        self.assertEqual(len(self.server.requests), 4)
+
+        encoder.close()
+
+    def test_transform_raises_without_retries(self):
+        encoder = UrlDataEncoder(lambda data: data, self.server.url + 'flaky/')
+
+        with self.assertRaises(Exception):
+            encoder.transform(self.records.iloc[0])
+
+        encoder.close()
+
+    def test_transform_raises_on_timeout(self):
+        encoder = UrlDataEncoder(lambda data: data, self.server.url + 'slow/', timeout=0.05)
+
+        with self.assertRaises(Exception):
+            encoder.transform(self.records.iloc[0])
+
+        encoder.close()
+
+
+class TestUrlDataEncoderWithCache(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalHttpServer()
+        self.records = [ record for _, record in
+                pd.DataFrame.from_records([ { 'id': 'id' + str(i) } for i in range(4) ]).iterrows() ]
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.close()
+        self.directory.cleanup()
+
+    def encoder(self, **kwargs):
+        return UrlDataEncoder(lambda data: data, self.server.url, concurrency=2,
+                cache=HttpCache(self.directory.name, **kwargs))
+
+    def test_transform_from_cache(self):
+        encoder = self.encoder()
+
+        for epoch in range(3):
+            self.assertSequenceEqual(encoder.transform_batch(self.records),
+                    [ 'data_' + str(i) for i in range(4) ])
+
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(encoder.cache.misses, 4)
+        self.assertEqual(encoder.cache.hits, 8)
+        self.assertEqual(encoder.cache.size, 4 * 6)
+
+        encoder.close()
+
+    def test_cache_persists_across_encoders(self):
+        encoder = self.encoder()
+        encoder.transform_batch(self.records)
+        encoder.close()
+
+        encoder = UrlDataEncoder(lambda data: data, self.server.url, cache=self.directory.name)
+
+        self.assertEqual(encoder.transform(self.records[2]), 'data_2')
+        self.assertEqual(len(self.server.requests), 4)
+
+        encoder.close()
+
+    def test_cache_of_pickled_encoder(self):
+        encoder = pickle.loads(pickle.dumps(UrlDataEncoder(str, self.server.url,
+                cache=HttpCache(self.directory.name))))
+
+        encoder.transform(self.records[0])
+        encoder.transform(self.records[0])
+
+        self.assertEqual(len(self.server.requests), 1)
+
+        encoder.close()
+
+    def test_binary_from_cache(self):
+        encoder = UrlDataEncoder(lambda data: data, self.server.url, type='binary',
+                cache=self.directory.name)
+
+        self.assertEqual(encoder.transform(self.records[1]), b'data_1')
+        self.assertEqual(encoder.transform(self.records[1]), b'data_1')
+        self.assertEqual(encoder.cache.hits, 1)
+
+        encoder.close()
+
+    def test_revalidate(self):
+        encoder = self.encoder(revalidate=True)
+
+        encoder.transform(self.records[0])
+        self.assertEqual(encoder.transform(self.records[0]), 'data_0')
+        self.assertEqual(self.server.not_modified, ['/id0'])
+        self.assertEqual(encoder.cache.revalidations, 1)
+
+        self.server.version = 1
+        self.assertEqual(encoder.transform(self.records[0]), 'data_0_v1')
+        self.assertEqual(encoder.transform(self.records[0]), 'data_0_v1')
+        self.assertEqual(self.server.not_modified, ['/id0', '/id0'])
+        self.assertEqual(len(self.server.requests), 4)
+
+        encoder.close()
+
+    def test_ttl(self):
+        encoder = self.encoder(ttl=60)
+
+        encoder.transform(self.records[0])
+        encoder.transform(self.records[0])
+        self.assertEqual(len(self.server.requests), 1)
+
+        with mock.patch('time.time', return_value=time.time() + 120):
+            self.assertEqual(encoder.transform(self.records[0]), 'data_0')
+            self.assertEqual(encoder.transform(self.records[0]), 'data_0')
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.not_modified, ['/id0'])
+
+        encoder.close()
+
+    def test_eviction(self):
+        encoder = self.encoder(max_bytes=3 * 6)
+        for record in self.records[:3]:
+            encoder.transform(record)
+
+        now = time.time()
+        for i, age in enumerate((0, 30, 20)):
+            key = hashlib.sha256((self.server.url + 'id' + str(i)).encode('utf-8')).hexdigest()
+            os.utime(os.path.join(self.directory.name, key + '.body'), (now - age, now - age))
+        encoder.transform(self.records[3])
+
+        self.assertEqual(encoder.cache.size, 3 * 6)
+        for i in (0, 2, 3):
+            encoder.transform(self.records[i])
+        self.assertEqual(len(self.server.requests), 4)
+
+        encoder.transform(self.records[1])
+        self.assertEqual(len(self.server.requests), 5)
+
+        encoder.close()
+
+    def test_raises_for_server_error(self):
+        encoder = UrlDataEncoder(lambda data: data, self.server.url + 'flaky/',
+                cache=self.directory.name)
+
+        with self.assertRaises(Exception):
+            encoder.transform(self.records[0])
+        self.assertEqual(encoder.cache.size, 0)
+
+        encoder.close()
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            HttpCache(self.directory.name, max_bytes=-1)
+        with self.assertRaises(ValueError):
+            HttpCache(self.directory.name, ttl=-1)
+
+
+class TestPaddingDataEncoder(unittest.TestCase):
+    def setUp(self):
+        self.records = pd.DataFrame.from_records([ { 'id': 'id1', 'size': 1 }, { 'id': 'id2', 'size': 3 } ])
+        self.encoder = PaddingDataEncoder(lambda record: [ 2 ] * record['size'], value=-1)
+
+    def test_transform(self):
+        self.assertEqual(self.encoder.transform(self.records.iloc[1]), [2, 2, 2])
+
+    def test_finalize_batch(self):
+        batch = self.encoder.finalize_batch([ self.encoder(record) for _, record in self.records.iterrows() ])
+
+        assert_array_equal(batch, [[2, -1, -1], [2, 2, 2]])
+
+    def test_finalize_batch_multidimensional(self):
+        encoder = PaddingDataEncoder(lambda record: np.ones((record['size'], 2)), dtype=np.float32)
+
+        batch = encoder.finalize_batch([ encoder(record) for _, record in self.records.iterrows() ])
+
+        self.assertEqual(batch.shape, (2, 3, 2))
+        self.assertEqual(batch.dtype, np.float32)
+        assert_array_equal(batch.sum(axis=(1, 2)), [2, 6])
+
+
+class TestCachingDataEncoder(unittest.TestCase):
+    def setUp(self):
+        self.records = pd.DataFrame.from_records([ { 'id': 'id' + str(i) } for i in range(10) ])
+        self.calls = []
+
+        def data_encoder(record):
+            self.calls.append(record['id'])
+            return np.full(100, int(record['id'][2:]), dtype=np.uint8)
+
+        self.data_encoder = data_encoder
+
+    def test_transform(self):
+        encoder = CachingDataEncoder(self.data_encoder, max_bytes=1000)
+
+        for _ in range(3):
+            for _, record in self.records.iterrows():
+                assert_array_equal(encoder.transform(record), [ int(record['id'][2:]) ] * 100)
+
+        self.assertEqual(len(self.calls), 10)
+        self.assertEqual(encoder.misses, 10)
+        self.assertEqual(encoder.hits, 20)
+        self.assertEqual(encoder.cached_bytes, 1000)
+
+    def test_evicts_least_recently_used(self):
+        encoder = CachingDataEncoder(self.data_encoder, max_bytes=300)
+
+        for position in [0, 1, 2, 0, 3, 1]:
+            encoder(self.records.iloc[position])
+
+        self.assertEqual(self.calls, ['id0', 'id1', 'id2', 'id3', 'id1'])
+        self.assertEqual(encoder.hits, 1)
+        self.assertEqual(encoder.misses, 5)
+        self.assertEqual(encoder.cached_bytes, 300)
+
+    def test_does_not_cache_records_exceeding_max_bytes(self):
+        encoder = CachingDataEncoder(self.data_encoder, max_bytes=50)
+
+        encoder(self.records.iloc[0])
+        encoder(self.records.iloc[0])
+
+        self.assertEqual(encoder.misses, 2)
+        self.assertEqual(encoder.cached_bytes, 0)
+
+    def test_clear(self):
+        encoder = CachingDataEncoder(self.data_encoder)
+        encoder(self.records.iloc[0])
+
+        encoder.clear()
+
+        self.assertEqual((encoder.hits, encoder.misses, encoder.cached_bytes), (0, 0, 0))
+
+    def test_thread_safety(self):
+        encoder = CachingDataEncoder(self.data_encoder, max_bytes=500)
+        records = [ record for _, record in self.records.iterrows() ] * 50
+
+        def transform_all(offset):
+            for record in records[offset:] + records[:offset]:
+                self.assertEqual(encoder(record)[0], int(record['id'][2:]))
+
+        threads = [ threading.Thread(target=transform_all, args=(offset,)) for offset in range(8) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(encoder.hits + encoder.misses, 8 * len(records))
+        self.assertLessEqual(encoder.cached_bytes, 500)
+
+    def test_pickle_starts_with_empty_cache(self):
+        encoder = CachingDataEncoder(IdentityEncoder(), id='id')
+        encoder(self.records.iloc[0])
+
+        copied = pickle.loads(pickle.dumps(encoder))
+
+        self.assertEqual(copied.cached_bytes, 0)
+        self.assertEqual(copied(self.records.iloc[1])['id'], 'id1')
+
+
+class TestIntToOneHotEncoder(unittest.TestCase):
+    def test_transform(self):
+        encoder = IntToOneHotEncoder().fit(np.array([0, 2, 1]))
+
+        encoded = encoder.transform(np.array([1, 0, 2, 1]))
+        self.assertEqual(encoded.dtype, np.float64)
+        assert_array_equal(encoded, [[0, 1, 0], [1, 0, 0], [0, 0, 1], [0, 1, 0]])
+        assert_array_equal(encoder.inverse_transform(encoded), [1, 0, 2, 1])
+
+    def test_transform_with_dtype(self):
+        for dtype in [np.uint8, np.float16, np.float32]:
+            encoder = IntToOneHotEncoder(dtype=dtype)
+
+            encoded = encoder.fit_transform(np.array([0, 1, 2]))
+            self.assertEqual(encoded.dtype, dtype)
+            assert_array_equal(encoded, np.eye(3))
+
+    def test_transform_sparse(self):
+        encoder = IntToOneHotEncoder(sparse=True, dtype=np.float32).fit(np.arange(5))
+
+        encoded = encoder.transform(np.array([4, 0, 3]))
+        self.assertEqual(encoded.format, 'csr')
+        self.assertEqual(encoded.dtype, np.float32)
+        self.assertEqual(encoded.shape, (3, 5))
+        assert_array_equal(encoded.toarray(), np.eye(5)[[4, 0, 3]])
+        assert_array_equal(encoder.inverse_transform(encoded), [4, 0, 3])
+
+    def test_transform_unknown_values(self):
+        encoder = IntToOneHotEncoder(n_values=3)
+
+        assert_array_equal(encoder.transform([1, 3, -1]), [[0, 1, 0], [0, 0, 0], [0, 0, 0]])
+
+        with self.assertRaises(ValueError):
+            IntToOneHotEncoder(n_values=3, handle_unknown='error').transform([1, 3])
+
+    def test_transform_raises_for_non_integer_values(self):
+        with self.assertRaises(ValueError):
+            IntToOneHotEncoder().fit(np.array(['a', 'b']))
+
+    def test_transform_raises_if_not_fitted(self):
+        with self.assertRaises(ValueError):
+            IntToOneHotEncoder().transform([0, 1])
+
+
 class TestRecordTargetEncoder(unittest.TestCase):
     def setUp(self):
         self.records = pd.DataFrame.from_records([
@@ -104,6 +752,18 @@ class TestRecordTargetEncoder(unittest.TestCase):
         self.assertEqual(encoder.inverse_transform(encoder.transform(self.records.iloc[[1]])), ['two'])
         self.assertEqual(encoder.inverse_transform(encoder.transform(self.records.iloc[[2]])), ['three'])
 
+    def test_compact_transform_and_expand(self):
+        encoder = OneHotRecordEncoder().fit(self.records)
+
+        compact = encoder.compact_transform(self.records)
+
+        self.assertEqual(compact.shape, (3,))
+        assert_array_equal(encoder.expand(compact), encoder.transform(self.records))
+
+        encoder = LabelRecordEncoder().fit(self.records)
+        assert_array_equal(encoder.expand(encoder.compact_transform(self.records)),
+                encoder.transform(self.records))
+
     def test_fit_transform(self):
         encoder = LabelRecordEncoder()
 
@@ -131,3 +791,12 @@ class TestRecordTargetEncoder(unittest.TestCase):
 
         self.assertEqual(set(encoder.classes_), set(['one', 'two', 'three']))
         assert_array_equal(encoder.inverse_transform([[1, 0, 0], [0, 1, 0], [0, 0 ,1]]), encoder.classes_)
+
+    def test_transform_with_target_column(self):
+        records = self.records.rename(columns={ 'target': 'label' })
+        encoder = OneHotRecordEncoder(target='label', dtype=np.uint8)
+
+        transformed = encoder.fit_transform(records)
+        self.assertEqual(transformed.dtype, np.uint8)
+        assert_array_equal(encoder.inverse_transform(transformed), records['label'])
+        assert_array_equal(LabelRecordEncoder(target='label').fit_transform(records), [0, 2, 1])
@@ -0,0 +1,108 @@
+import threading
+import unittest
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from numblr.datagenerator.execution import prefetch, SharedMemoryRing
+
+
+class TestPrefetch(unittest.TestCase):
+    def test_prefetch(self):
+        self.assertSequenceEqual(list(prefetch(lambda x: x * x, range(10), size=3, workers=2)),
+                [ x * x for x in range(10) ])
+
+    def test_prefetch_is_bounded(self):
+        submitted = []
+
+        def items():
+            for item in range(100):
+                submitted.append(item)
+                yield item
+
+        generator = prefetch(lambda x: x, items(), size=4, workers=2)
+
+        self.assertEqual(next(generator), 0)
+        self.assertEqual(len(submitted), 5)
+
+        generator.close()
+
+    def test_prefetch_raises_exception_in_order(self):
+        def fail_on_three(x):
+            if x == 3:
+                raise KeyError(x)
+
+            return x
+
+        generator = prefetch(fail_on_three, range(10), size=5, workers=5)
+
+        self.assertSequenceEqual([ next(generator) for _ in range(3) ], [0, 1, 2])
+        with self.assertRaises(KeyError):
+            next(generator)
+
+    def test_prefetch_monitor(self):
+        done = threading.Event()
+        completed = threading.Semaphore(0)
+        depths = []
+
+        def wait_for_done(x):
+            if x > 0:
+                done.wait()
+            completed.release()
+
+            return x
+
+        generator = prefetch(wait_for_done, range(4), size=3, workers=3, monitor=depths.append)
+        self.assertEqual(next(generator), 0)
+        self.assertIn(depths[0], [0, 1])
+
+        done.set()
+        for _ in range(4):
+            completed.acquire()
+
+        self.assertSequenceEqual(list(generator), [1, 2, 3])
+        self.assertEqual(depths[1:], [3, 2, 1])
+
+    def test_prefetch_raises_on_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            prefetch(lambda x: x, range(10), size=0)
+
+        with self.assertRaises(ValueError):
+            prefetch(lambda x: x, range(10), workers=0)
+
+
+class TestSharedMemoryRing(unittest.TestCase):
+    def setUp(self):
+        self.ring = SharedMemoryRing((4, 3), np.float32, 2)
+
+    def tearDown(self):
+        self.ring.close()
+
+    def test_view(self):
+        memory = self.ring.acquire()
+
+        view = self.ring.view(memory)
+        view[:] = np.arange(12).reshape(4, 3)
+
+        self.assertEqual(view.dtype, np.float32)
+        assert_array_equal(self.ring.view(memory, 2), [[0, 1, 2], [3, 4, 5]])
+
+        self.ring.release(memory)
+
+    def test_acquire_blocks_until_release(self):
+        first = self.ring.acquire()
+        second = self.ring.acquire()
+        self.assertNotEqual(first.name, second.name)
+
+        acquired = []
+        thread = threading.Thread(target=lambda: acquired.append(self.ring.acquire()))
+        thread.start()
+        thread.join(0.05)
+        self.assertEqual(acquired, [])
+
+        self.ring.release(first)
+        thread.join(1.0)
+        self.assertEqual([ memory.name for memory in acquired ], [first.name])
+
+        self.ring.release(second)
+        self.ring.release(acquired[0])
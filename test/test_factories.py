@@ -1,7 +1,17 @@
+import os
+import shutil
+import tarfile
+import tempfile
 import unittest
+from unittest import mock
 
-from numblr.datagenerator.encoders import LabelEncoder, IntToOneHotEncoder
-from numblr.datagenerator.factories import generator_for_files
+import numpy as np
+import pandas as pd
+
+from numblr.datagenerator.encoders import LabelEncoder, IntToOneHotEncoder, FileDataEncoder
+from numblr.datagenerator.dataset import GeneratorDataSet
+from numblr.datagenerator.samplers import LocalitySampler
+from numblr.datagenerator.factories import generator_for_files, generator_for_archives, enrich_inventory
 
 
 class TestGeneratorDataSet(unittest.TestCase):
@@ -39,3 +49,141 @@ class TestGeneratorDataSet(unittest.TestCase):
         shapes = { batch[1].shape for batch in batches }
         self.assertEqual(len(shapes), 1)
         self.assertEqual(shapes.pop(), (4,3))
+
+    def test_enrich_inventory(self):
+        inventory = pd.read_csv('test/resources/inventory.csv')
+        encoder = FileDataEncoder(self.data_encoder, 'test/resources', self.id_mapper)
+
+        enriched = enrich_inventory(inventory, encoder, include_meta={ 'size': 'size', 'path': 'file' })
+
+        self.assertSequenceEqual(list(enriched.index), [ 'id' + str(i) for i in range(1, 11) ])
+        self.assertSequenceEqual(list(enriched['size']), [7] * 9 + [8])
+        self.assertEqual(enriched.loc['id10', 'file'], 'test/resources/id10.txt')
+
+    def test_archives(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'data.tar')
+            with tarfile.open(path, 'w') as archive:
+                for i in range(10, 0, -1):
+                    archive.add('test/resources/id{}.txt'.format(i), arcname='id{}.txt'.format(i))
+
+            data_set = generator_for_archives('test/resources/inventory.csv', path,
+                    self.data_encoder, LabelEncoder(), self.id_mapper)
+            files_data_set = generator_for_files('test/resources/inventory.csv', 'test/resources',
+                    self.data_encoder, LabelEncoder(), self.id_mapper)
+
+            self.assertSequenceEqual(list(data_set.inventory['size']), [7] * 9 + [8])
+            np.testing.assert_array_equal(data_set.data(), files_data_set.data())
+            np.testing.assert_array_equal(data_set.targets(), files_data_set.targets())
+
+            batches = data_set.data_batches(batch_size=5, epochs=1,
+                    sampler=LocalitySampler(data_set.data_encoder))
+            np.testing.assert_array_equal(np.concatenate(list(batches)), list(range(10, 0, -1)))
+
+
+class TestMetadataCache(unittest.TestCase):
+    def setUp(self):
+        def data_encoder(file):
+            return int(file.readline().split('_')[1])
+
+        self.data_encoder = data_encoder
+        self.directory = tempfile.TemporaryDirectory()
+        self.data_path = os.path.join(self.directory.name, 'data')
+        shutil.copytree('test/resources', self.data_path)
+        self.inventory_path = os.path.join(self.directory.name, 'inventory.csv')
+        shutil.move(os.path.join(self.data_path, 'inventory.csv'), self.inventory_path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def generator(self):
+        return generator_for_files(self.inventory_path, self.data_path,
+                self.data_encoder, LabelEncoder(), id_mapper, cache_metadata=True)
+
+    def test_warm_start_skips_metadata_and_fit(self):
+        cold = self.generator()
+        self.assertTrue(os.path.exists(self.inventory_path + '.meta'))
+
+        with mock.patch('numblr.datagenerator.factories.enrich_inventory') as enrich, \
+                mock.patch.object(GeneratorDataSet, 'fit_encoders') as fit:
+            warm = self.generator()
+            enrich.assert_not_called()
+            fit.assert_not_called()
+
+        self.assertSequenceEqual(list(warm.inventory['size']), list(cold.inventory['size']))
+        self.assertSequenceEqual(list(warm.inventory.index), list(cold.inventory.index))
+        np.testing.assert_array_equal(warm.targets(), cold.targets())
+        np.testing.assert_array_equal(warm.data(), cold.data())
+
+    def test_failed_metadata_is_not_cached(self):
+        def enrich_without_size(inventory, resource_encoder, id):
+            return enrich_inventory(inventory, resource_encoder, id, include_meta={})
+
+        with mock.patch('numblr.datagenerator.factories.enrich_inventory',
+                side_effect=enrich_without_size):
+            data_set = self.generator()
+
+        self.assertNotIn('size', data_set.inventory)
+        self.assertFalse(os.path.exists(self.inventory_path + '.meta'))
+
+    def test_changed_inventory_invalidates_cache(self):
+        self.generator()
+        with open(self.inventory_path, 'a') as inventory:
+            inventory.write('id11,x\n')
+        with open(os.path.join(self.data_path, 'id11.txt'), 'w') as data:
+            data.write('data_11\n')
+
+        with mock.patch('numblr.datagenerator.factories.enrich_inventory',
+                side_effect=enrich_inventory) as enrich:
+            data_set = self.generator()
+            enrich.assert_called_once()
+
+        self.assertEqual(len(data_set.inventory), 11)
+
+    def test_changed_data_directory_invalidates_cache(self):
+        self.generator()
+        stat = os.stat(self.data_path)
+        os.utime(self.data_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        with mock.patch('numblr.datagenerator.factories.enrich_inventory',
+                side_effect=enrich_inventory) as enrich:
+            self.generator()
+            enrich.assert_called_once()
+
+    def test_warm_start_with_inventory_in_data_directory(self):
+        self.inventory_path = os.path.join(self.data_path, 'inventory.csv')
+        shutil.move(os.path.join(self.directory.name, 'inventory.csv'), self.inventory_path)
+        self.generator()
+
+        with mock.patch('numblr.datagenerator.factories.enrich_inventory') as enrich:
+            for _ in range(2):
+                self.generator()
+            enrich.assert_not_called()
+
+        with open(os.path.join(self.data_path, 'id11.txt'), 'w') as data:
+            data.write('data_11\n')
+        with mock.patch('numblr.datagenerator.factories.enrich_inventory',
+                side_effect=enrich_inventory) as enrich:
+            self.generator()
+            enrich.assert_called_once()
+
+    def test_changed_encoder_parameters_invalidate_cache(self):
+        for dtype in (np.float64, np.uint8):
+            data_set = generator_for_files(self.inventory_path, self.data_path, self.data_encoder,
+                    [LabelEncoder(), IntToOneHotEncoder(dtype=dtype)], id_mapper, cache_metadata=True)
+
+            self.assertEqual(data_set.targets().dtype, dtype)
+
+    def test_corrupt_sidecar_is_rebuilt(self):
+        with open(self.inventory_path + '.meta', 'wb') as sidecar:
+            sidecar.write(b'corrupt')
+
+        data_set = self.generator()
+
+        self.assertEqual(len(data_set.inventory), 10)
+        with open(self.inventory_path + '.meta', 'rb') as sidecar:
+            self.assertNotEqual(sidecar.read(), b'corrupt')
+
+
+def id_mapper(id):
+    return id + '.txt'
@@ -0,0 +1,45 @@
+import sys
+import json
+import unittest
+import subprocess
+
+
+def imported_modules(statement):
+    """Execute the statement in a fresh interpreter and return the names of
+    the imported modules."""
+    script = statement + "\nimport sys, json\nprint(json.dumps(sorted(sys.modules)))"
+    output = subprocess.run([sys.executable, '-c', script], check=True, stdout=subprocess.PIPE).stdout
+
+    return set(json.loads(output))
+
+
+class TestLazyImports(unittest.TestCase):
+    def test_package_defers_imports(self):
+        modules = imported_modules("import numblr.datagenerator")
+
+        self.assertNotIn('numblr.datagenerator.factories', modules)
+        self.assertNotIn('sklearn', modules)
+        self.assertNotIn('requests', modules)
+
+    def test_encoders_defer_sklearn_and_requests(self):
+        modules = imported_modules("from numblr.datagenerator import FileDataEncoder, UrlDataEncoder")
+
+        self.assertNotIn('sklearn', modules)
+        self.assertNotIn('requests', modules)
+
+    def test_public_names(self):
+        import numblr.datagenerator as datagenerator
+        from numblr.datagenerator.encoders import LabelEncoder
+
+        self.assertIs(datagenerator.LabelEncoder, LabelEncoder)
+        self.assertEqual(LabelEncoder.__module__.split('.')[0], 'sklearn')
+        self.assertIn('generator_for_files', dir(datagenerator))
+        self.assertTrue(callable(datagenerator.generator_for_files))
+
+    def test_unknown_name(self):
+        import numblr.datagenerator as datagenerator
+
+        with self.assertRaises(AttributeError):
+            datagenerator.NoSuchEncoder
+        with self.assertRaises(ImportError):
+            from numblr.datagenerator.encoders import NoSuchEncoder
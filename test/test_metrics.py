@@ -0,0 +1,47 @@
+import unittest
+
+from numblr.datagenerator.metrics import MetricsCollector
+
+
+class TestMetricsCollector(unittest.TestCase):
+    def setUp(self):
+        self.collector = MetricsCollector(buckets=(0.01, 0.1))
+
+    def test_summary(self):
+        self.collector.observe_stage('transform', 0.5)
+        self.collector.observe_stage('transform', 1.5)
+        self.collector.observe_record(0, 0.005)
+        self.collector.observe_record(0, 0.05)
+        self.collector.observe_record(0, 0.5)
+        self.collector.set_gauge('prefetch_queue_depth', 2)
+
+        summary = self.collector.summary()
+
+        self.assertEqual(summary['stages'], { 'transform': { 'count': 2, 'seconds': 2.0, 'mean': 1.0, 'max': 1.5 } })
+        self.assertEqual(summary['records'][0]['count'], 3)
+        self.assertAlmostEqual(summary['records'][0]['seconds'], 0.555)
+        self.assertEqual(summary['records'][0]['buckets'], { 0.01: 1, 0.1: 2 })
+        self.assertEqual(summary['gauges'], { 'prefetch_queue_depth': 2 })
+
+    def test_reset(self):
+        self.collector.observe_stage('transform', 0.5)
+        self.collector.reset()
+
+        self.assertEqual(self.collector.summary(), { 'stages': {}, 'records': {}, 'gauges': {} })
+
+    def test_to_prometheus(self):
+        self.collector.observe_stage('targets', 0.25)
+        self.collector.observe_record(1, 0.05)
+        self.collector.set_gauge('prefetch_queue_depth', 3)
+
+        lines = self.collector.to_prometheus(prefix='test').splitlines()
+
+        self.assertIn('# TYPE test_stage_seconds summary', lines)
+        self.assertIn('test_stage_seconds_sum{stage="targets"} 0.25', lines)
+        self.assertIn('test_stage_seconds_count{stage="targets"} 1', lines)
+        self.assertIn('# TYPE test_record_seconds histogram', lines)
+        self.assertIn('test_record_seconds_bucket{encoder="1",le="0.01"} 0', lines)
+        self.assertIn('test_record_seconds_bucket{encoder="1",le="0.1"} 1', lines)
+        self.assertIn('test_record_seconds_bucket{encoder="1",le="+Inf"} 1', lines)
+        self.assertIn('test_record_seconds_count{encoder="1"} 1', lines)
+        self.assertIn('test_prefetch_queue_depth 3', lines)
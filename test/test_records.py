@@ -0,0 +1,58 @@
+import pickle
+import unittest
+
+from pandas import DataFrame
+
+from numblr.datagenerator.records import Record, inventory_records
+
+
+class TestRecord(unittest.TestCase):
+    def setUp(self):
+        self.inventory = DataFrame.from_records([
+                { 'id': 'id_{}'.format(i), 'target': 'cat_{}'.format(i % 3), 'size': i }
+                for i in range(5) ], index=[ 'row_{}'.format(i) for i in range(5) ])
+        self.records = inventory_records(self.inventory)
+
+    def test_inventory_records(self):
+        self.assertEqual(len(self.records), 5)
+        self.assertTrue(all(isinstance(record, Record) for record in self.records))
+
+    def test_records_match_iterrows(self):
+        for record, (name, row) in zip(self.records, self.inventory.iterrows()):
+            self.assertEqual(record.name, name)
+            self.assertEqual(record['id'], row['id'])
+            self.assertEqual(record['target'], row['target'])
+            self.assertEqual(record['size'], row['size'])
+            self.assertSequenceEqual(list(record), list(row))
+
+    def test_attribute_access(self):
+        self.assertEqual(self.records[2].id, 'id_2')
+        self.assertEqual(self.records[2].size, 2)
+
+        with self.assertRaises(AttributeError):
+            self.records[2].unknown
+
+    def test_item_access_raises_on_unknown_column(self):
+        with self.assertRaises(KeyError):
+            self.records[0]['unknown']
+
+    def test_mapping_methods(self):
+        record = self.records[1]
+
+        self.assertTrue('id' in record)
+        self.assertFalse('unknown' in record)
+        self.assertEqual(record.get('target'), 'cat_1')
+        self.assertEqual(record.get('unknown', 'default'), 'default')
+        self.assertSequenceEqual(record.keys(), ['id', 'target', 'size'])
+        self.assertEqual(record.to_dict(), { 'id': 'id_1', 'target': 'cat_1', 'size': 1 })
+        self.assertEqual(len(record), 3)
+
+    def test_pickle(self):
+        record = pickle.loads(pickle.dumps(self.records[3]))
+
+        self.assertEqual(record.name, 'row_3')
+        self.assertEqual(record['id'], 'id_3')
+        self.assertEqual(record.target, 'cat_0')
+
+    def test_empty_inventory(self):
+        self.assertEqual(inventory_records(self.inventory.iloc[:0]), [])
@@ -0,0 +1,146 @@
+import unittest
+
+import numpy as np
+from pandas import DataFrame
+
+from numblr.datagenerator.samplers import (SequentialSampler, ShuffleSampler, BucketSampler,
+        DistributedSampler, LocalitySampler)
+
+
+class TestSamplers(unittest.TestCase):
+    def setUp(self):
+        self.inventory = DataFrame.from_records([
+                { 'id': 'id_{}'.format(i), 'size': (i * 7) % 20 } for i in range(20) ])
+
+    def positions(self, batches):
+        return [ list(np.arange(len(self.inventory))[batch]) for batch in batches ]
+
+    def test_sequential_sampler(self):
+        batches = SequentialSampler().epoch_batches(self.inventory, 6, True, 0, 0)
+
+        self.assertEqual(self.positions(batches),
+                [ list(range(0, 6)), list(range(6, 12)), list(range(12, 18)) ])
+
+    def test_sequential_sampler_not_truncated(self):
+        batches = SequentialSampler().epoch_batches(self.inventory, 6, False, 0, 0)
+
+        self.assertEqual(len(batches), 4)
+        self.assertEqual(self.positions(batches)[-1], [18, 19])
+
+    def test_shuffle_sampler(self):
+        sampler = ShuffleSampler()
+
+        first = self.positions(sampler.epoch_batches(self.inventory, 5, True, 1, 0))
+        second = self.positions(sampler.epoch_batches(self.inventory, 5, True, 1, 1))
+
+        self.assertEqual(sorted(sum(first, [])), list(range(20)))
+        self.assertEqual(sorted(sum(second, [])), list(range(20)))
+        self.assertNotEqual(first, second)
+        self.assertEqual(first, self.positions(sampler.epoch_batches(self.inventory, 5, True, 1, 0)))
+
+    def test_bucket_sampler(self):
+        sampler = BucketSampler(bucket_batches=2)
+        sizes = self.inventory['size'].to_numpy()
+
+        batches = sampler.epoch_batches(self.inventory, 5, True, 3, 0)
+
+        self.assertEqual(len(batches), 4)
+        self.assertEqual(sorted(np.concatenate(batches)), list(range(20)))
+        for batch in batches:
+            self.assertLess(sizes[batch].max() - sizes[batch].min(), 10)
+
+    def test_bucket_sampler_shuffles_each_epoch(self):
+        sampler = BucketSampler(bucket_batches=2)
+
+        first = self.positions(sampler.epoch_batches(self.inventory, 5, True, 3, 0))
+        second = self.positions(sampler.epoch_batches(self.inventory, 5, True, 3, 1))
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(first, self.positions(sampler.epoch_batches(self.inventory, 5, True, 3, 0)))
+
+    def test_bucket_sampler_not_shuffled(self):
+        sampler = BucketSampler(bucket_batches=1, shuffle=False)
+        sizes = self.inventory['size'].to_numpy()
+
+        batches = sampler.epoch_batches(self.inventory, 4, False, 3, 0)
+
+        self.assertEqual(list(np.concatenate([ sizes[batch] for batch in batches ])), sorted(sizes))
+
+    def test_bucket_sampler_updates_with_inventory(self):
+        sampler = BucketSampler(bucket_batches=1, shuffle=False)
+        sampler.epoch_batches(self.inventory, 4, False, 3, 0)
+
+        self.inventory['size'] = -self.inventory['size']
+        sizes = self.inventory['size'].to_numpy()
+
+        batches = sampler.epoch_batches(self.inventory, 4, False, 3, 0)
+        self.assertEqual(list(np.concatenate([ sizes[batch] for batch in batches ])), sorted(sizes))
+
+    def test_bucket_sampler_raises_on_invalid_bucket_batches(self):
+        with self.assertRaises(ValueError):
+            BucketSampler(bucket_batches=0)
+
+    def test_distributed_sampler(self):
+        shards = [ self.positions(DistributedSampler(ShuffleSampler(), 3, index)
+                .epoch_batches(self.inventory, 3, True, 4, 1)) for index in range(3) ]
+
+        self.assertEqual([ len(batches) for batches in shards ], [2, 2, 2])
+        positions = [ position for batches in shards for batch in batches for position in batch ]
+        self.assertEqual(len(set(positions)), 18)
+
+        expected = self.positions(ShuffleSampler().epoch_batches(self.inventory, 3, True, 4, 1))
+        self.assertEqual(shards[1], [ expected[1], expected[4] ])
+
+    def test_distributed_sampler_drops_uneven_batches(self):
+        shards = [ self.positions(DistributedSampler(SequentialSampler(), 3, index)
+                .epoch_batches(self.inventory, 6, False, 0, 0)) for index in range(3) ]
+
+        self.assertEqual(shards, [ [list(range(0, 6))], [list(range(6, 12))], [list(range(12, 18))] ])
+
+    def test_distributed_sampler_shards_have_equal_size(self):
+        self.inventory = self.inventory.iloc[:10]
+
+        for sampler, batch_size, num_shards in ((SequentialSampler(), 3, 2), (ShuffleSampler(), 4, 3),
+                (BucketSampler(bucket_batches=2), 3, 2)):
+            shards = [ self.positions(DistributedSampler(sampler, num_shards, index)
+                    .epoch_batches(self.inventory, batch_size, False, 5, 0))
+                    for index in range(num_shards) ]
+
+            sizes = { sum(len(batch) for batch in batches) for batches in shards }
+            self.assertEqual(len(sizes), 1)
+            self.assertTrue(all(len(batch) == batch_size for batches in shards for batch in batches))
+
+    def test_distributed_sampler_raises_on_invalid_shards(self):
+        with self.assertRaises(ValueError):
+            DistributedSampler(SequentialSampler(), 0, 0)
+
+        with self.assertRaises(ValueError):
+            DistributedSampler(SequentialSampler(), 2, 2)
+
+    def test_locality_sampler(self):
+        encoder = SizeOrderEncoder()
+        sampler = LocalitySampler(encoder)
+
+        batches = sampler.epoch_batches(self.inventory, 6, False, 0, 0)
+        self.assertEqual(self.positions(batches),
+                [ list(batch) for batch in np.array_split(np.argsort(self.inventory['size']), [6, 12, 18]) ])
+
+        sampler.epoch_batches(self.inventory, 6, False, 0, 1)
+        self.assertEqual(encoder.calls, 1)
+
+        sampler.epoch_batches(self.inventory.iloc[::-1], 6, False, 0, 2)
+        self.assertEqual(encoder.calls, 2)
+
+    def test_locality_sampler_raises_without_locality_order(self):
+        with self.assertRaises(ValueError):
+            LocalitySampler(object())
+
+
+class SizeOrderEncoder:
+    def __init__(self):
+        self.calls = 0
+
+    def locality_order(self, inventory):
+        self.calls += 1
+
+        return np.argsort(inventory['size'].to_numpy())
@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from numpy.testing import assert_array_equal
+from pandas import DataFrame
+from scipy.sparse import csr_matrix
+
+from numblr.datagenerator.dataset import GeneratorDataSet
+from numblr.datagenerator.factories import generator_for_shards
+from numblr.datagenerator.shards import ShardWriter, ShardReader, shard_path
+
+
+class TestShards(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_write_and_read(self):
+        writer = ShardWriter(self.path, 10, 4)
+        writer.write('data', 0, np.arange(6).reshape(3, 2))
+        writer.write('data', 3, np.arange(6, 20).reshape(7, 2))
+        writer.close()
+
+        self.assertEqual([ len(np.load(shard_path(self.path, 'data', shard))) for shard in range(3) ],
+                [4, 4, 2])
+
+        reader = ShardReader(self.path, 'data')
+        assert_array_equal(reader.read([1, 1], [0, 1]), [[8, 9], [10, 11]])
+        assert_array_equal(reader.read([2, 0, 1], [1, 0, 3]), [[18, 19], [0, 1], [14, 15]])
+
+    def test_write_raises_on_shape_mismatch(self):
+        writer = ShardWriter(self.path, 10, 4)
+        writer.write('data', 0, np.zeros((2, 2)))
+
+        with self.assertRaises(ValueError):
+            writer.write('data', 2, np.zeros((2, 3)))
+
+    def test_write_raises_on_unsafe_cast(self):
+        writer = ShardWriter(self.path, 10, 4)
+        writer.write('data', 0, np.zeros((2, 2), dtype=np.int32))
+        writer.write('data', 2, np.ones((1, 2), dtype=np.int16))
+
+        with self.assertRaises(ValueError):
+            writer.write('data', 3, np.full((1, 2), 2**40))
+
+    def test_materialize(self):
+        inventory = DataFrame.from_records([
+                { 'id': 'id_{}'.format(i), 'target': i % 3 } for i in range(10) ])
+
+        def data_encoder(record):
+            return np.full(3, int(record['id'].split('_')[-1]), dtype=np.float32)
+
+        def target_encoder(records):
+            return np.eye(3)[records['target'].to_numpy()]
+
+        data_set = GeneratorDataSet(inventory, data_encoder, target_encoder)
+        data_set.materialize(self.path, shard_size=4, batch_size=3)
+
+        materialized = generator_for_shards(self.path)
+        self.assertEqual(materialized.size, 10)
+        self.assertSequenceEqual(list(materialized.inventory['id']), list(inventory['id']))
+
+        data = materialized.data()
+        self.assertEqual(data.dtype, np.float32)
+        assert_array_equal(data, data_set.data())
+        assert_array_equal(materialized.targets(), data_set.targets())
+
+        for (data, targets), (expected_data, expected_targets) in zip(
+                materialized.batches(batch_size=3, epochs=1, shuffle_each_epoch=True, random_state=1),
+                data_set.batches(batch_size=3, epochs=1, shuffle_each_epoch=True, random_state=1)):
+            assert_array_equal(data, expected_data)
+            assert_array_equal(targets, expected_targets)
+
+    def test_materialize_sparse_targets(self):
+        inventory = DataFrame.from_records([
+                { 'id': i, 'target': i % 3 } for i in range(5) ])
+        data_set = GeneratorDataSet(inventory, lambda record: record['id'],
+                lambda records: csr_matrix(np.eye(3)[records['target'].to_numpy()]))
+
+        data_set.materialize(self.path, shard_size=2, batch_size=2)
+
+        materialized = generator_for_shards(self.path)
+        assert_array_equal(materialized.targets(), np.eye(3)[[0, 1, 2, 0, 1]])
+
+    def test_materialize_multiple_data_encoders_without_targets(self):
+        inventory = DataFrame.from_records([ { 'id': i } for i in range(5) ])
+        data_set = GeneratorDataSet(inventory, [ lambda record: record['id'], lambda record: -record['id'] ])
+
+        data_set.materialize(self.path, shard_size=2)
+
+        materialized = generator_for_shards(self.path)
+        self.assertIsNone(materialized.target_encoder)
+
+        first, second = next(materialized.data_batches(batch_size=5, epochs=1))
+        assert_array_equal(first, range(5))
+        assert_array_equal(second, -np.arange(5))